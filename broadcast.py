@@ -1,13 +1,26 @@
 import asyncio
+import functools
+import glob
+import json
 import logging
+import os
+import re
+import secrets
 import time
-from dataclasses import dataclass
-from typing import List, Dict, Optional, Union
+from datetime import datetime
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, List, Dict, Optional, Set, Union
+import reachability
 import user_referral_system as urs
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
+from rate_limiter import AdaptiveRateController, SharedTokenBucket, TokenBucket
+from recipients import RecipientSnapshot, data_path, snapshot_path
+from segments import Segment
+from send_metrics import SendMetrics, write_report
+from sharded_broadcast import ShardCheckpoint, ShardTask, ShardedRun, plan_shards
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, Message
 from config import get_admin_user_id
 from telegram.ext import CommandHandler, CallbackContext, Application, MessageHandler, filters, CallbackQueryHandler
-from telegram.error import RetryAfter, Forbidden, TelegramError
+from telegram.error import BadRequest, RetryAfter, Forbidden, TelegramError, TimedOut
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -20,8 +33,222 @@ class BroadcastConfig:
     ADMIN_USER_ID: int = get_admin_user_id()
     MAX_RETRIES: int = 3
     RETRY_DELAY: float = 2.0
-    RATE_LIMIT_DELAY: float = 0.05
-    PROGRESS_UPDATE_INTERVAL: int = 50
+    WORKER_COUNT: int = 8  # send tasks per process
+    PROCESS_COUNT: int = 1  # above 1, shards the recipients across worker processes
+    MESSAGES_PER_SECOND: float = 25.0  # starting rate, adjusted while sending
+    MIN_MESSAGES_PER_SECOND: float = 1.0
+    MAX_MESSAGES_PER_SECOND: float = 30.0
+    RATE_INCREASE: float = 1.0  # messages/sec added per second of successful sends
+    RATE_DECREASE_FACTOR: float = 0.5
+    PROGRESS_UPDATE_SECONDS: float = 5.0
+    CHECKPOINT_INTERVAL: float = 5.0
+    SCHEDULER_INTERVAL: float = 15.0
+
+def new_broadcast_id() -> str:
+    return f"{time.strftime('broadcast-%Y%m%d-%H%M%S')}-{secrets.token_hex(2)}"
+
+def parse_schedule_time(text: str, now: Optional[float] = None) -> float:
+    """Parses ``+30m``/``+2h``/``+1d`` or ``YYYY-MM-DD HH:MM`` (server local time) into a timestamp."""
+    now = time.time() if now is None else now
+    match = re.fullmatch(r"\+(\d+)([mhd])", text.strip())
+    if match:
+        return now + int(match.group(1)) * {"m": 60, "h": 3600, "d": 86400}[match.group(2)]
+    return datetime.strptime(text.strip(), "%Y-%m-%d %H:%M").timestamp()
+
+@dataclass
+class BroadcastJob:
+    """A broadcast waiting in the queue. Higher ``priority`` runs first among due jobs."""
+    job_id: str
+    from_chat_id: int
+    message_id: int
+    button_details: List[str] = field(default_factory=list)
+    run_at: float = 0.0
+    priority: int = 0
+    created_at: float = field(default_factory=time.time)
+    # Audience as Segment.to_dict(); empty means all users
+    segment: Dict = field(default_factory=dict)
+
+    def sort_key(self):
+        return (-self.priority, self.run_at, self.created_at)
+
+class BroadcastJobQueue:
+    """Broadcast jobs persisted to a JSON file so schedules survive restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.jobs: List[BroadcastJob] = []
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r") as f:
+                self.jobs = [BroadcastJob(**job) for job in json.load(f)]
+        except FileNotFoundError:
+            self.jobs = []
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"Could not load broadcast queue {self.path}: {e}")
+            self.jobs = []
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([asdict(job) for job in self.jobs], f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def add(self, job: BroadcastJob) -> None:
+        self.jobs.append(job)
+        self.save()
+
+    def remove(self, job_id: str) -> Optional[BroadcastJob]:
+        for job in self.jobs:
+            if job.job_id == job_id:
+                self.jobs.remove(job)
+                self.save()
+                return job
+        return None
+
+    def next_due(self, now: Optional[float] = None) -> Optional[BroadcastJob]:
+        """Returns the highest-priority job whose start time has passed, leaving it queued."""
+        now = time.time() if now is None else now
+        due = [job for job in self.jobs if job.run_at <= now]
+        return min(due, key=BroadcastJob.sort_key) if due else None
+
+    def pending(self) -> List[BroadcastJob]:
+        """Returns all queued jobs in the order they would start."""
+        return sorted(self.jobs, key=lambda job: (job.run_at, job.sort_key()))
+
+@dataclass(frozen=True)
+class CopyPayload:
+    """The ``copyMessage`` parameters shared by every recipient of a broadcast.
+
+    The keyboard is serialized to JSON once and passed through ``api_kwargs``,
+    which the request layer sends as is; per recipient only ``chat_id`` changes.
+    """
+    from_chat_id: int
+    message_id: int
+    api_kwargs: Optional[Dict[str, str]] = None
+
+    @classmethod
+    def build(cls, from_chat_id: int, message_id: int, reply_markup: Optional[InlineKeyboardMarkup]) -> "CopyPayload":
+        api_kwargs = {"reply_markup": reply_markup.to_json()} if reply_markup else None
+        return cls(from_chat_id, message_id, api_kwargs)
+
+@dataclass
+class BroadcastCheckpoint:
+    """Persistent progress of one broadcast, enough to resume it after a restart.
+
+    Recipients are addressed by their offset in the broadcast's recipient
+    snapshot. Every offset below ``cursor`` is done; because workers finish
+    out of order, offsets at or above it that are already done are kept in
+    ``done_after``. Offsets whose send failed without the user being
+    unreachable are counted as passed but kept in ``failed``, and are sent
+    again on resume. A broadcast sent by worker processes tracks each shard's
+    offset range the same way in ``shards``, past the shared ``cursor``.
+    Sends completed after the last save may be repeated on resume.
+    """
+    broadcast_id: str
+    from_chat_id: int
+    message_id: int
+    button_details: List[str] = field(default_factory=list)
+    total_users: int = 0
+    cursor: int = 0
+    done_after: Set[int] = field(default_factory=set)
+    failed: Set[int] = field(default_factory=set)
+    messages_sent: int = 0
+    users_blocked: int = 0
+    elapsed: float = 0.0
+    users_to_remove: List[int] = field(default_factory=list)
+    progress_message_id: Optional[int] = None
+    segment: Dict = field(default_factory=dict)
+    metrics: Dict = field(default_factory=dict)
+    shards: List[ShardCheckpoint] = field(default_factory=list)
+
+    @staticmethod
+    def path_for(broadcast_id: str) -> str:
+        return data_path(f"{broadcast_id}.checkpoint.json")
+
+    @property
+    def path(self) -> str:
+        return self.path_for(self.broadcast_id)
+
+    @property
+    def snapshot_path(self) -> str:
+        return snapshot_path(self.broadcast_id)
+
+    @property
+    def report_path(self) -> str:
+        return data_path(f"{self.broadcast_id}.report.json")
+
+    @property
+    def completed(self) -> int:
+        return (
+            self.cursor + len(self.done_after) - len(self.failed)
+            + sum(shard.completed for shard in self.shards)
+        )
+
+    @property
+    def failed_count(self) -> int:
+        return len(self.failed) + sum(len(shard.failed) for shard in self.shards)
+
+    def mark_done(self, offset: int) -> None:
+        if offset in self.failed:
+            self.failed.remove(offset)
+            return
+        self._advance(offset)
+
+    def mark_failed(self, offset: int) -> None:
+        if offset not in self.failed:
+            self.failed.add(offset)
+            self._advance(offset)
+
+    def _advance(self, offset: int) -> None:
+        if offset < self.cursor:
+            return
+        self.done_after.add(offset)
+        while self.cursor in self.done_after:
+            self.done_after.remove(self.cursor)
+            self.cursor += 1
+
+    def save(self) -> None:
+        data = asdict(self)
+        data["done_after"] = sorted(self.done_after)
+        data["failed"] = sorted(self.failed)
+        data["shards"] = [shard.to_dict() for shard in self.shards]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    @classmethod
+    def load(cls, path: str) -> "BroadcastCheckpoint":
+        with open(path, "r") as f:
+            data = json.load(f)
+        data["done_after"] = set(data.get("done_after", ()))
+        data["failed"] = set(data.get("failed", ()))
+        data["shards"] = [ShardCheckpoint.from_dict(shard) for shard in data.get("shards", ())]
+        return cls(**data)
+
+    @classmethod
+    def find_all(cls) -> List["BroadcastCheckpoint"]:
+        """Returns the checkpoints of all unfinished broadcasts, oldest first."""
+        checkpoints = []
+        for path in sorted(glob.glob(cls.path_for("*"))):
+            try:
+                checkpoints.append(cls.load(path))
+            except (OSError, ValueError, TypeError) as e:
+                logger.error(f"Could not load broadcast checkpoint {path}: {e}")
+        return checkpoints
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
 
 class BroadcastState:
     def __init__(self):
@@ -32,8 +259,16 @@ class BroadcastState:
         self.total_users: int = 0
         self.messages_sent: int = 0
         self.users_blocked: int = 0
+        # Sends that failed in this run and are retried on /resume
+        self.users_failed: int = 0
         self.is_running: bool = False
         self.current_batch: int = 0
+        # Live progress message in the admin chat
+        self.progress_message_id: Optional[int] = None
+        self.progress_text: Optional[str] = None
+        self.recent_rate: float = 0.0
+        self.last_progress_time: Optional[float] = None
+        self.last_progress_batch: int = 0
 
 class BroadcastManager:
     def __init__(self, config: BroadcastConfig):
@@ -42,6 +277,44 @@ class BroadcastManager:
         self.pending_broadcasts: Dict[int, Message] = {}
         self.button_details: Dict[int, List[str]] = {}
         self.in_button_setup: Dict[int, bool] = {}
+        self.segments: Dict[int, Segment] = {}
+        self.rate_controller: Optional[AdaptiveRateController] = None
+        self.metrics = SendMetrics()
+        # Creates the Bot of each worker process; defaults to one with the running bot's token
+        self.bot_factory: Optional[Callable[[], Any]] = None
+        # The running broadcast task and its controls
+        self.task: Optional[asyncio.Task] = None
+        self.checkpoint: Optional[BroadcastCheckpoint] = None
+        self.sharded_run: Optional[ShardedRun] = None
+        self._unpaused = asyncio.Event()
+        self._unpaused.set()
+        self._cancel_requested = False
+        self._shutting_down = False
+        self.queue = BroadcastJobQueue(data_path("broadcast_jobs.json"))
+        self.queue.load()
+
+    def __getstate__(self):
+        # bot_data is pickled by the persistence layer; tasks and rate state are runtime only.
+        state = self.__dict__.copy()
+        for name in ("task", "rate_controller", "metrics", "checkpoint", "sharded_run", "_unpaused", "queue"):
+            state.pop(name)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("segments", {})
+        self.__dict__.setdefault("bot_factory", None)
+        self.state.is_running = False
+        self.rate_controller = None
+        self.metrics = SendMetrics()
+        self.task = None
+        self.checkpoint = None
+        self.sharded_run = None
+        self._unpaused = asyncio.Event()
+        self._unpaused.set()
+        self._shutting_down = False
+        self.queue = BroadcastJobQueue(data_path("broadcast_jobs.json"))
+        self.queue.load()
 
     def is_admin(self, user_id: int) -> bool:
         return user_id == self.config.ADMIN_USER_ID
@@ -60,28 +333,65 @@ class BroadcastManager:
         self,
         context: CallbackContext,
         user_id: int,
-        message: Message,
-        reply_markup: Optional[InlineKeyboardMarkup] = None
+        payload: CopyPayload
     ) -> bool:
-        for attempt in range(self.config.MAX_RETRIES):
+        """Sends ``payload`` to ``user_id``. ``RetryAfter`` waits do not count against ``MAX_RETRIES``."""
+        attempt = 1
+        while attempt <= self.config.MAX_RETRIES:
+            if self.rate_controller is not None:
+                self.metrics.pacing_wait_seconds += await self.rate_controller.bucket.acquire()
+            started = time.perf_counter()
             try:
-                await message.copy(
+                await context.bot.copy_message(
                     chat_id=user_id,
-                    reply_markup=reply_markup
+                    from_chat_id=payload.from_chat_id,
+                    message_id=payload.message_id,
+                    api_kwargs=payload.api_kwargs
                 )
-                await asyncio.sleep(self.config.RATE_LIMIT_DELAY)
-                return True
             except RetryAfter as e:
-                await asyncio.sleep(e.retry_after)
-            except Forbidden:
-                return False
+                self.metrics.record_request(time.perf_counter() - started, e)
+                await self._wait_retry_after(e)
+                continue
             except TelegramError as e:
-                if attempt == self.config.MAX_RETRIES - 1:
-                    logger.error(f"Failed to send message to {user_id}: {e}")
+                self.metrics.record_request(time.perf_counter() - started, e)
+                if not await self._should_retry(user_id, e, attempt):
+                    self.metrics.record_outcome(attempt)
                     return False
-                await asyncio.sleep(self.config.RETRY_DELAY)
+                attempt += 1
+                continue
+            self.metrics.record_request(time.perf_counter() - started)
+            self.metrics.record_outcome(attempt)
+            if self.rate_controller is not None:
+                self.rate_controller.on_success()
+            return True
+        self.metrics.record_outcome(self.config.MAX_RETRIES)
         return False
 
+    async def _wait_retry_after(self, error: RetryAfter) -> None:
+        self.metrics.record_retry_after(error.retry_after)
+        if self.rate_controller is not None:
+            # Pauses the shared bucket, so every worker waits out the flood limit.
+            self.rate_controller.on_throttle(error.retry_after)
+        else:
+            await asyncio.sleep(error.retry_after)
+
+    async def _should_retry(self, user_id: int, error: TelegramError, attempt: int) -> bool:
+        """Reacts to a failed send other than ``RetryAfter``. Returns True if it should be attempted again."""
+        if isinstance(error, Forbidden):
+            reachability.record_error(user_id, error)
+            return False
+        if isinstance(error, TimedOut):
+            if self.rate_controller is not None:
+                self.rate_controller.on_throttle()
+        elif reachability.record_error(user_id, error):
+            return False
+        if attempt == self.config.MAX_RETRIES:
+            logger.error(f"Failed to send message to {user_id}: {error}")
+            return False
+        self.metrics.retry_delay_seconds += self.config.RETRY_DELAY
+        await asyncio.sleep(self.config.RETRY_DELAY)
+        return True
+
     def create_button_markup(self, button_details: List[str]) -> InlineKeyboardMarkup:
         keyboard = []
         for i in range(0, len(button_details), 2):
@@ -95,85 +405,501 @@ class BroadcastManager:
         self,
         context: CallbackContext,
         message: Message,
-        button_details: Optional[List[str]]
+        button_details: Optional[List[str]],
+        segment: Optional[Segment] = None
     ) -> None:
+        checkpoint = BroadcastCheckpoint(
+            broadcast_id=new_broadcast_id(),
+            from_chat_id=message.chat_id,
+            message_id=message.message_id,
+            button_details=list(button_details or []),
+            segment=segment.to_dict() if segment else {}
+        )
+        await self.run_broadcast(context, checkpoint, resume=False)
+
+    def enqueue(
+        self,
+        message: Message,
+        button_details: Optional[List[str]],
+        run_at: Optional[float] = None,
+        priority: int = 0,
+        segment: Optional[Segment] = None
+    ) -> BroadcastJob:
+        """Adds a broadcast to the persistent queue; it starts once due and nothing else is running."""
+        job = BroadcastJob(
+            job_id=new_broadcast_id(),
+            from_chat_id=message.chat_id,
+            message_id=message.message_id,
+            button_details=list(button_details or []),
+            run_at=time.time() if run_at is None else run_at,
+            priority=priority,
+            segment=segment.to_dict() if segment else {}
+        )
+        self.queue.add(job)
+        return job
+
+    def start_due_job(self, context: CallbackContext) -> Optional[BroadcastJob]:
+        """Starts the next due job in the background unless a broadcast is running."""
+        if self.state.is_running:
+            return None
+        job = self.queue.next_due()
+        if job is None:
+            return None
+        checkpoint = BroadcastCheckpoint(
+            broadcast_id=job.job_id,
+            from_chat_id=job.from_chat_id,
+            message_id=job.message_id,
+            button_details=job.button_details,
+            segment=job.segment
+        )
+        # The job leaves the queue only once its checkpoint is on disk, so a
+        # crash in between leaves it queued or resumable, never lost.
         try:
-            self.state.reset()
-            self.state.is_running = True
-            self.state.start_time = time.time()
+            checkpoint.save()
+        except OSError as e:
+            logger.exception(f"Error saving checkpoint for broadcast {job.job_id}: {e}")
+            return None
+        self.queue.remove(job.job_id)
+        self.state.is_running = True
+        self.task = asyncio.create_task(self.run_broadcast(context, checkpoint, resume=False))
+        return job
 
-            data = urs.load_data()
-            if not data:
-                await self.send_admin_message(context, "❌ Error loading user data")
-                return
+    async def resume_broadcast(self, context: CallbackContext, checkpoint: BroadcastCheckpoint) -> None:
+        await self.run_broadcast(context, checkpoint, resume=True)
 
-            users = data.get("users", {})
-            self.state.total_users = len(users)
-            users_to_remove = []
-            reply_markup = self.create_button_markup(button_details) if button_details else None
+    def start_resume(self, context: CallbackContext, checkpoint: BroadcastCheckpoint) -> None:
+        """Runs :meth:`resume_broadcast` as a background task owned by the manager."""
+        self.state.is_running = True
+        self.task = asyncio.create_task(self.resume_broadcast(context, checkpoint))
 
-            for batch_index, user_id in enumerate(users.keys()):
-                self.state.current_batch = batch_index + 1
+    @property
+    def is_paused(self) -> bool:
+        return not self._unpaused.is_set()
 
-                success = await self.send_with_retry(
-                    context,
-                    int(user_id),
-                    message,
-                    reply_markup
-                )
+    def pause(self) -> None:
+        """Stops handing recipients to the workers; in-flight sends finish."""
+        self._unpaused.clear()
+        if self.sharded_run is not None:
+            self.sharded_run.pause()
+        if self.checkpoint is not None:
+            self._save_checkpoint(self.checkpoint)
 
-                if success:
-                    self.state.messages_sent += 1
-                else:
-                    self.state.users_blocked += 1
-                    users_to_remove.append(user_id)
+    def unpause(self) -> None:
+        self._unpaused.set()
+        if self.sharded_run is not None:
+            self.sharded_run.unpause()
 
-                if self.state.current_batch % self.config.PROGRESS_UPDATE_INTERVAL == 0:
-                    await self.send_progress_update(context)
+    def cancel(self) -> None:
+        """Stops the running broadcast for good; blocked users found so far are still removed."""
+        if self.task is not None and not self.task.done():
+            self._cancel_requested = True
+            self._unpaused.set()
+            self.task.cancel()
 
-            for user_id in users_to_remove:
-                del users[user_id]
+    async def shutdown(self) -> None:
+        """Stops the running broadcast and keeps its checkpoint so /resume can continue it."""
+        self._shutting_down = True
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
 
-            data["users"] = users
-            data["total_users"] = len(users)
-            urs.save_data(data)
+    async def run_broadcast(self, context: CallbackContext, checkpoint: BroadcastCheckpoint, resume: bool) -> None:
+        snapshot = None
+        timer_tasks = []
+        try:
+            self.state.reset()
+            self.state.is_running = True
+            self.state.start_time = time.time() - checkpoint.elapsed
+            self.checkpoint = checkpoint
+            self._cancel_requested = False
+            self._unpaused.set()
 
-            await self.send_broadcast_summary(context)
+            if resume and os.path.exists(checkpoint.snapshot_path):
+                snapshot = RecipientSnapshot(checkpoint.snapshot_path)
+                checkpoint.total_users = len(snapshot)
+            else:
+                # New, or stopped before its recipients were frozen.
+                if not await urs.is_available_async():
+                    await self.send_admin_message(context, "❌ Error loading user data")
+                    return
+
+                # Freeze the recipient set into a memory-mapped snapshot so the
+                # broadcast neither holds the user table nor sees users that
+                # register while it runs. Offsets into it identify recipients
+                # in the checkpoint.
+                snapshot = await RecipientSnapshot.create(
+                    checkpoint.snapshot_path, Segment.from_dict(checkpoint.segment)
+                )
+                checkpoint.total_users = len(snapshot)
+                checkpoint.save()
+
+            self.state.total_users = len(snapshot)
+            self.state.messages_sent = checkpoint.messages_sent
+            self.state.users_blocked = checkpoint.users_blocked
+            self.state.current_batch = checkpoint.completed
+            self.state.last_progress_batch = checkpoint.completed
+            self.state.progress_message_id = checkpoint.progress_message_id
+            payload = CopyPayload.build(
+                checkpoint.from_chat_id,
+                checkpoint.message_id,
+                self.create_button_markup(checkpoint.button_details) if checkpoint.button_details else None
+            )
+
+            # Workers pull recipients from a bounded queue and share one token
+            # bucket, so requests overlap while the total stays at the rate the
+            # controller settles on. A sharded broadcast resumes sharded.
+            sharded = self.config.PROCESS_COUNT > 1 or bool(checkpoint.shards)
+            bucket_type = SharedTokenBucket if sharded else TokenBucket
+            self.rate_controller = AdaptiveRateController(
+                bucket_type(self.config.MESSAGES_PER_SECOND),
+                min_rate=self.config.MIN_MESSAGES_PER_SECOND,
+                max_rate=self.config.MAX_MESSAGES_PER_SECOND,
+                increase=self.config.RATE_INCREASE,
+                decrease=self.config.RATE_DECREASE_FACTOR
+            )
+            self.metrics = SendMetrics.from_dict(checkpoint.metrics)
+            timer_tasks = [
+                asyncio.create_task(self._checkpoint_loop(checkpoint)),
+                asyncio.create_task(self._progress_loop(context))
+            ]
+            if sharded:
+                await self._run_sharded(context, snapshot, checkpoint, payload)
+            else:
+                queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.WORKER_COUNT * 2)
+                tasks = [asyncio.create_task(self._enqueue_recipients(snapshot, checkpoint, queue))]
+                tasks += [
+                    asyncio.create_task(self._send_worker(context, queue, checkpoint, payload))
+                    for _ in range(self.config.WORKER_COUNT)
+                ]
+                try:
+                    await asyncio.gather(*tasks)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+            for task in timer_tasks:
+                task.cancel()
+            if checkpoint.failed_count:
+                await self._finish_broadcast(context, checkpoint, snapshot, "⚠️ Broadcast Incomplete", keep=True)
+            else:
+                await self._finish_broadcast(context, checkpoint, snapshot, "✅ Broadcast Complete")
+        except asyncio.CancelledError:
+            for task in timer_tasks:
+                task.cancel()
+            if not self._cancel_requested:
+                # Shutting down: keep the checkpoint for /resume.
+                if snapshot is not None:
+                    self._save_checkpoint(checkpoint)
+                raise
+            if snapshot is None:
+                snapshot = RecipientSnapshot(checkpoint.snapshot_path) if os.path.exists(checkpoint.snapshot_path) else None
+            if snapshot is not None:
+                await self._finish_broadcast(context, checkpoint, snapshot, "🛑 Broadcast Cancelled")
+            else:
+                checkpoint.remove()
+                await self.send_admin_message(context, "🛑 Broadcast cancelled before it started sending.")
         except Exception as e:
             logger.exception("Broadcast error")
-            await self.send_admin_message(context, f"❌ Broadcast error: {str(e)}")
+            if snapshot is not None:
+                self._save_checkpoint(checkpoint)
+            await self.send_admin_message(
+                context,
+                f"❌ Broadcast error: {str(e)}\nUse /resume {checkpoint.broadcast_id} to continue it."
+            )
         finally:
             self.state.is_running = False
+            self.checkpoint = None
+            if not self._shutting_down:
+                # Run whatever became due meanwhile without waiting for the next scheduler tick.
+                asyncio.get_running_loop().call_soon(self.start_due_job, context)
+            for task in timer_tasks:
+                task.cancel()
+            if snapshot is not None:
+                snapshot.close()
 
-    async def send_progress_update(self, context: CallbackContext) -> None:
-        if not self.state.is_running:
-            return
+    async def _run_sharded(
+        self,
+        context: CallbackContext,
+        snapshot: RecipientSnapshot,
+        checkpoint: BroadcastCheckpoint,
+        payload: CopyPayload
+    ) -> None:
+        """Sends from one worker process per shard; see :mod:`sharded_broadcast`."""
+        if not checkpoint.shards:
+            checkpoint.shards = plan_shards(
+                checkpoint.cursor, len(snapshot), checkpoint.done_after, self.config.PROCESS_COUNT, checkpoint.failed
+            )
+            checkpoint.done_after = set()
+            checkpoint.failed = set()
+        # Workers read the registry from disk and report what they add to it.
+        reachability.flush()
+        bot_factory = self.bot_factory or functools.partial(Bot, context.bot.token)
+        tasks = [
+            ShardTask(index, shard, snapshot.path, reachability.get_registry_path(), payload, self.config, bot_factory)
+            for index, shard in enumerate(checkpoint.shards)
+            if not shard.is_done
+        ]
+        self.sharded_run = ShardedRun(tasks, self.rate_controller.bucket)
+        if self.is_paused:
+            self.sharded_run.pause()
+        try:
+            await self.sharded_run.run(functools.partial(self._apply_shard_report, checkpoint))
+        finally:
+            self.sharded_run = None
+
+    def _apply_shard_report(self, checkpoint: BroadcastCheckpoint, report: Dict) -> None:
+        shard = checkpoint.shards[report["shard"]]
+        for offset in report["done"]:
+            shard.mark_done(offset)
+        for offset in report["failed"]:
+            shard.mark_failed(offset)
+        self.state.messages_sent += report["sent"]
+        self.state.users_blocked += report["blocked"]
+        self.state.users_failed += len(report["failed"])
+        self.state.current_batch += len(report["done"])
+        checkpoint.users_to_remove.extend(report["remove"])
+        for user_id in report["unreachable"]:
+            reachability.mark_unreachable(user_id)
+        if "metrics" in report:
+            self.metrics.merge(SendMetrics.from_dict(report["metrics"]))
+            self.rate_controller.decreases += report["decreases"]
 
-        progress = (self.state.current_batch / self.state.total_users) * 100 if self.state.total_users > 0 else 0
+    async def _finish_broadcast(
+        self,
+        context: CallbackContext,
+        checkpoint: BroadcastCheckpoint,
+        snapshot: RecipientSnapshot,
+        title: str,
+        keep: bool = False
+    ) -> None:
+        """Removes the blocked users and reports the result.
+
+        With ``keep`` the snapshot and checkpoint stay so /resume can retry the failed sends.
+        """
+        self._save_checkpoint(checkpoint)
+        await self.close_progress_message(context, title)
+        # Remove through the store so registrations made while the
+        # broadcast ran are kept.
+        await urs.remove_users_async(checkpoint.users_to_remove)
+        self._write_report(checkpoint, title)
+        if keep:
+            checkpoint.users_to_remove = []
+            self._save_checkpoint(checkpoint)
+        else:
+            snapshot.remove()
+            checkpoint.remove()
+        await self.send_broadcast_summary(context, title, checkpoint.report_path)
+        if keep:
+            await self.send_admin_message(
+                context,
+                f"Use /resume {checkpoint.broadcast_id} to retry the {checkpoint.failed_count} failed recipients."
+            )
+
+    def _write_report(self, checkpoint: BroadcastCheckpoint, title: str) -> None:
+        """Writes the machine-readable ``<id>.report.json`` next to the data file."""
+        rate = checkpoint.messages_sent / checkpoint.elapsed if checkpoint.elapsed > 0 else 0
+        report = {
+            "broadcast_id": checkpoint.broadcast_id,
+            "result": title,
+            "finished_at": time.time(),
+            "segment": checkpoint.segment,
+            "total_users": checkpoint.total_users,
+            "messages_sent": checkpoint.messages_sent,
+            "users_blocked": checkpoint.users_blocked,
+            "users_failed": checkpoint.failed_count,
+            "elapsed": checkpoint.elapsed,
+            "messages_per_second": rate,
+            "metrics": checkpoint.metrics,
+        }
+        try:
+            write_report(checkpoint.report_path, report)
+        except OSError as e:
+            logger.exception(f"Error writing broadcast report: {e}")
+
+    def _save_checkpoint(self, checkpoint: BroadcastCheckpoint) -> None:
+        checkpoint.messages_sent = self.state.messages_sent
+        checkpoint.users_blocked = self.state.users_blocked
+        checkpoint.elapsed = time.time() - self.state.start_time
+        checkpoint.progress_message_id = self.state.progress_message_id
+        if self.rate_controller is not None:
+            self.metrics.track_pauses(self.rate_controller.bucket)
+        checkpoint.metrics = self.metrics.to_dict()
+        try:
+            checkpoint.save()
+        except OSError as e:
+            logger.exception(f"Error saving broadcast checkpoint: {e}")
+
+    async def _checkpoint_loop(self, checkpoint: BroadcastCheckpoint) -> None:
+        while True:
+            await asyncio.sleep(self.config.CHECKPOINT_INTERVAL)
+            self._save_checkpoint(checkpoint)
+
+    async def _progress_loop(self, context: CallbackContext) -> None:
+        while True:
+            await self.update_progress_message(context)
+            await asyncio.sleep(self.config.PROGRESS_UPDATE_SECONDS)
+
+    async def _enqueue_recipients(
+        self,
+        snapshot: RecipientSnapshot,
+        checkpoint: BroadcastCheckpoint,
+        queue: asyncio.Queue
+    ) -> None:
+        for offset, user_id in self._recipients_to_send(snapshot, checkpoint):
+            if reachability.is_unreachable(user_id):
+                # Known to fail: count it as blocked without a request.
+                self.state.users_blocked += 1
+                self.state.current_batch += 1
+                checkpoint.users_to_remove.append(int(user_id))
+                checkpoint.mark_done(offset)
+                continue
+            await queue.put((offset, int(user_id)))
+        for _ in range(self.config.WORKER_COUNT):
+            await queue.put(None)
+
+    @staticmethod
+    def _recipients_to_send(snapshot: RecipientSnapshot, checkpoint: BroadcastCheckpoint):
+        # Recipients whose sends failed in an earlier run go first.
+        for offset in sorted(checkpoint.failed):
+            yield offset, snapshot[offset]
+        done_after = set(checkpoint.done_after)
+        for offset, user_id in snapshot.iter_from(checkpoint.cursor):
+            if offset not in done_after:
+                yield offset, user_id
+
+    async def _send_worker(
+        self,
+        context: CallbackContext,
+        queue: asyncio.Queue,
+        checkpoint: BroadcastCheckpoint,
+        payload: CopyPayload
+    ) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            offset, user_id = item
+            await self._unpaused.wait()
+
+            success = await self.send_with_retry(context, user_id, payload)
+
+            if success:
+                self.state.messages_sent += 1
+            elif reachability.is_unreachable(user_id):
+                self.state.users_blocked += 1
+                checkpoint.users_to_remove.append(user_id)
+            else:
+                # Not a reason to drop the user; /resume sends it again.
+                self.state.users_failed += 1
+                checkpoint.mark_failed(offset)
+                continue
+            checkpoint.mark_done(offset)
+            self.state.current_batch += 1
+
+    def format_progress(self) -> str:
+        total = self.state.total_users
+        progress = (self.state.current_batch / total) * 100 if total > 0 else 0
         elapsed = time.time() - self.state.start_time
-        rate = self.state.messages_sent / elapsed if elapsed > 0 else 0
+        rate = self.state.recent_rate or (self.state.messages_sent / elapsed if elapsed > 0 else 0)
+        limit = self.rate_controller.rate if self.rate_controller else 0
+        remaining = total - self.state.current_batch
+        eta = format_duration(remaining / rate) if rate > 0 else "unknown"
 
-        await self.send_admin_message(
-            context,
-            f"📊 Broadcast Progress:\n"
-            f"Progress: {progress:.1f}%\n"
+        return (
+            f"📊 Broadcast Progress{' (paused)' if self.is_paused else ''}:\n"
+            f"Progress: {progress:.1f}% ({self.state.current_batch}/{total})\n"
             f"Sent: {self.state.messages_sent}\n"
             f"Blocked: {self.state.users_blocked}\n"
-            f"Rate: {rate:.1f} messages/sec"
+            f"Failed: {self.state.users_failed}\n"
+            f"Rate: {rate:.1f} messages/sec\n"
+            f"Current send rate limit: {limit:.1f} messages/sec\n"
+            f"Elapsed: {format_duration(elapsed)}\n"
+            f"ETA: {eta}"
         )
 
-    async def send_broadcast_summary(self, context: CallbackContext) -> None:
+    async def send_progress_update(self, context: CallbackContext) -> None:
+        """Sends the current progress as a new admin message (for /progress)."""
+        if not self.state.is_running:
+            return
+        await self.send_admin_message(context, self.format_progress())
+
+    async def update_progress_message(self, context: CallbackContext) -> None:
+        """Edits the pinned progress message in place, creating and pinning it the first time."""
+        now = time.monotonic()
+        if self.state.last_progress_time is not None and now > self.state.last_progress_time:
+            instant = (self.state.current_batch - self.state.last_progress_batch) / (now - self.state.last_progress_time)
+            self.state.recent_rate = instant if not self.state.recent_rate else 0.5 * instant + 0.5 * self.state.recent_rate
+        self.state.last_progress_time = now
+        self.state.last_progress_batch = self.state.current_batch
+
+        text = self.format_progress()
+        if text == self.state.progress_text:
+            return
+        await self._show_progress(context, text)
+        self.state.progress_text = text
+
+    async def close_progress_message(self, context: CallbackContext, title: str) -> None:
+        """Leaves the final numbers in the progress message and unpins it."""
+        if self.state.progress_message_id is None:
+            return
+        await self._show_progress(context, f"{title}\n\n{self.format_progress()}")
+        try:
+            await context.bot.unpin_chat_message(
+                chat_id=self.config.ADMIN_USER_ID,
+                message_id=self.state.progress_message_id
+            )
+        except TelegramError as e:
+            logger.warning(f"Could not unpin progress message: {e}")
+
+    async def _show_progress(self, context: CallbackContext, text: str) -> None:
+        if self.state.progress_message_id is not None:
+            try:
+                await context.bot.edit_message_text(
+                    chat_id=self.config.ADMIN_USER_ID,
+                    message_id=self.state.progress_message_id,
+                    text=text
+                )
+                return
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return
+                # The message was deleted; post a new one below.
+                logger.warning(f"Could not edit progress message: {e}")
+            except TelegramError as e:
+                logger.warning(f"Could not edit progress message: {e}")
+                return
+
+        try:
+            message = await context.bot.send_message(chat_id=self.config.ADMIN_USER_ID, text=text)
+            self.state.progress_message_id = message.message_id
+            await context.bot.pin_chat_message(
+                chat_id=self.config.ADMIN_USER_ID,
+                message_id=message.message_id,
+                disable_notification=True
+            )
+        except TelegramError as e:
+            logger.warning(f"Could not post progress message: {e}")
+
+    async def send_broadcast_summary(
+        self,
+        context: CallbackContext,
+        title: str = "✅ Broadcast Complete",
+        report_path: Optional[str] = None
+    ) -> None:
         elapsed = time.time() - self.state.start_time
         rate = self.state.messages_sent / elapsed if elapsed > 0 else 0
         await self.send_admin_message(
             context,
-            f"✅ Broadcast Complete\n\n"
+            f"{title}\n\n"
             f"📊 Statistics:\n"
             f"Total Users: {self.state.total_users}\n"
             f"Messages Sent: {self.state.messages_sent}\n"
             f"Users Blocked: {self.state.users_blocked}\n"
+            f"Failed: {self.state.users_failed}\n"
             f"Time Taken: {elapsed:.1f}s\n"
-            f"Average Rate: {rate:.1f} messages/sec"
+            f"Average Rate: {rate:.1f} messages/sec\n\n"
+            f"{self.metrics.format_summary()}"
+            + (f"\n\n📄 Report: {os.path.basename(report_path)}" if report_path else "")
         )
 
 async def broadcast_start(update: Update, context: CallbackContext) -> None:
@@ -191,16 +917,22 @@ async def broadcast_start(update: Update, context: CallbackContext) -> None:
     if not manager.is_admin(update.effective_user.id):
         return
 
-    if manager.state.is_running:
-        await update.message.reply_text("⚠️ A broadcast is already running")
+    try:
+        segment = Segment.parse(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(f"❌ {e}")
         return
 
+    if manager.state.is_running:
+        await update.message.reply_text("ℹ️ A broadcast is running; the new one will be queued after it.")
+
     manager.pending_broadcasts[update.effective_user.id] = None
     manager.button_details[update.effective_user.id] = []
     manager.in_button_setup[update.effective_user.id] = False
+    manager.segments[update.effective_user.id] = segment
 
     await update.message.reply_text(
-        "📝 Please send the message you want to broadcast\n"
+        f"📝 Please send the message you want to broadcast to {segment.describe()}\n"
         "(text, photo, video, etc.)"
     )
     
@@ -239,7 +971,13 @@ async def receive_broadcast_message(update: Update, context: CallbackContext) ->
 
     try:
         # Send preview message
-        preview_text = "📢 Broadcast Preview:"
+        segment = manager.segments.get(user.id) or Segment()
+        audience_size = await urs.count_segment_async(segment)
+        preview_text = (
+            f"📢 Broadcast Preview:\n"
+            f"🎯 Audience: {segment.describe()} ({audience_size} users)\n"
+            f"(Use /schedule <+2h|YYYY-MM-DD HH:MM> [priority] to send it later)"
+        )
         await context.bot.send_message(
             chat_id=user.id,
             text=preview_text
@@ -255,6 +993,7 @@ async def receive_broadcast_message(update: Update, context: CallbackContext) ->
         manager.pending_broadcasts.pop(user.id, None)
         manager.button_details.pop(user.id, None)
         manager.in_button_setup.pop(user.id, None)
+        manager.segments.pop(user.id, None)
 
 async def handle_button_details(update: Update, context: CallbackContext) -> None:
     manager = context.bot_data.get('broadcast_manager')
@@ -344,15 +1083,21 @@ async def handle_callback(update: Update, context: CallbackContext) -> None:
         elif query.data == "verify_broadcast":
             message_to_broadcast = manager.pending_broadcasts.get(query.from_user.id)
             if message_to_broadcast:
-                await manager.broadcast_messages(
-                    context,
+                job = manager.enqueue(
                     message_to_broadcast,
-                    manager.button_details.get(query.from_user.id)
+                    manager.button_details.get(query.from_user.id),
+                    segment=manager.segments.get(query.from_user.id)
                 )
-                # Clean up after broadcast
+                started = manager.start_due_job(context)
                 manager.pending_broadcasts.pop(query.from_user.id, None)
                 manager.button_details.pop(query.from_user.id, None)
                 manager.in_button_setup.pop(query.from_user.id, None)
+                manager.segments.pop(query.from_user.id, None)
+                if started is not None and started.job_id == job.job_id:
+                    text = "🚀 Broadcast started. Use /progress, /pause or /cancel_broadcast to control it."
+                else:
+                    text = f"🕒 Broadcast {job.job_id} queued. It starts when the current broadcast finishes. See /queue."
+                await context.bot.send_message(chat_id=query.from_user.id, text=text)
             else:
                 await context.bot.send_message(
                     chat_id=query.from_user.id,
@@ -364,6 +1109,7 @@ async def handle_callback(update: Update, context: CallbackContext) -> None:
             manager.pending_broadcasts.pop(query.from_user.id, None)
             manager.button_details.pop(query.from_user.id, None)
             manager.in_button_setup.pop(query.from_user.id, None)
+            manager.segments.pop(query.from_user.id, None)
             await context.bot.send_message(
                 chat_id=query.from_user.id,
                 text="✖️ Broadcast cancelled."
@@ -392,6 +1138,172 @@ async def handle_progress(update: Update, context: CallbackContext) -> None:
 
     await manager.send_progress_update(context)
 
+async def handle_resume(update: Update, context: CallbackContext) -> None:
+    manager = context.bot_data.get('broadcast_manager')
+
+    if not manager:
+        return
+
+    if not manager.is_admin(update.effective_user.id):
+        await update.message.reply_text("⚠️ You are not authorized to use this command.")
+        return
+
+    if manager.state.is_running:
+        if manager.is_paused:
+            manager.unpause()
+            await update.message.reply_text("▶️ Broadcast resumed.")
+        else:
+            await update.message.reply_text("⚠️ A broadcast is already running")
+        return
+
+    checkpoints = BroadcastCheckpoint.find_all()
+    if context.args:
+        checkpoints = [checkpoint for checkpoint in checkpoints if checkpoint.broadcast_id == context.args[0]]
+    if not checkpoints:
+        await update.message.reply_text("ℹ️ No interrupted broadcast to resume.")
+        return
+
+    checkpoint = checkpoints[-1]
+    if not os.path.exists(checkpoint.snapshot_path):
+        # Offsets only make sense against the snapshot they were recorded for.
+        if checkpoint.completed or checkpoint.failed_count:
+            await update.message.reply_text(f"❌ The recipient list of {checkpoint.broadcast_id} is missing.")
+            return
+        await update.message.reply_text(f"▶️ Starting {checkpoint.broadcast_id}, which stopped before it began sending")
+    else:
+        await update.message.reply_text(
+            f"▶️ Resuming {checkpoint.broadcast_id} at {checkpoint.completed}/{checkpoint.total_users} recipients"
+        )
+    manager.start_resume(context, checkpoint)
+
+async def handle_pause(update: Update, context: CallbackContext) -> None:
+    manager = context.bot_data.get('broadcast_manager')
+
+    if not manager:
+        return
+
+    if not manager.is_admin(update.effective_user.id):
+        await update.message.reply_text("⚠️ You are not authorized to use this command.")
+        return
+
+    if not manager.state.is_running:
+        await update.message.reply_text("ℹ️ No broadcast is currently running.")
+        return
+
+    manager.pause()
+    await update.message.reply_text("⏸ Broadcast paused. Use /resume to continue or /cancel_broadcast to stop it.")
+
+async def handle_cancel_broadcast(update: Update, context: CallbackContext) -> None:
+    manager = context.bot_data.get('broadcast_manager')
+
+    if not manager:
+        return
+
+    if not manager.is_admin(update.effective_user.id):
+        await update.message.reply_text("⚠️ You are not authorized to use this command.")
+        return
+
+    if not manager.state.is_running:
+        await update.message.reply_text("ℹ️ No broadcast is currently running.")
+        return
+
+    manager.cancel()
+    await update.message.reply_text("🛑 Cancelling broadcast...")
+
+async def handle_schedule(update: Update, context: CallbackContext) -> None:
+    """/schedule <+30m|+2h|+1d|YYYY-MM-DD HH:MM> [priority] queues the previewed broadcast."""
+    manager = context.bot_data.get('broadcast_manager')
+
+    if not manager:
+        return
+
+    if not manager.is_admin(update.effective_user.id):
+        await update.message.reply_text("⚠️ You are not authorized to use this command.")
+        return
+
+    message_to_broadcast = manager.pending_broadcasts.get(update.effective_user.id)
+    if not message_to_broadcast:
+        await update.message.reply_text("❌ No message to broadcast found. Start with /broadcast.")
+        return
+
+    args = list(context.args or [])
+    try:
+        if args and args[0].startswith("+"):
+            run_at = parse_schedule_time(args.pop(0))
+        else:
+            run_at = parse_schedule_time(" ".join(args[:2]))
+            args = args[2:]
+        priority = int(args[0]) if args else 0
+    except ValueError:
+        await update.message.reply_text(
+            "Usage: /schedule <+30m|+2h|+1d|YYYY-MM-DD HH:MM> [priority]\n"
+            "Higher priority runs first when several broadcasts are due."
+        )
+        return
+
+    job = manager.enqueue(
+        message_to_broadcast,
+        manager.button_details.get(update.effective_user.id),
+        run_at,
+        priority,
+        manager.segments.get(update.effective_user.id)
+    )
+    manager.pending_broadcasts.pop(update.effective_user.id, None)
+    manager.button_details.pop(update.effective_user.id, None)
+    manager.in_button_setup.pop(update.effective_user.id, None)
+    manager.segments.pop(update.effective_user.id, None)
+    await update.message.reply_text(
+        f"🕒 Broadcast {job.job_id} scheduled for {time.strftime('%Y-%m-%d %H:%M', time.localtime(run_at))} "
+        f"with priority {priority}."
+    )
+
+async def handle_queue(update: Update, context: CallbackContext) -> None:
+    manager = context.bot_data.get('broadcast_manager')
+
+    if not manager:
+        return
+
+    if not manager.is_admin(update.effective_user.id):
+        await update.message.reply_text("⚠️ You are not authorized to use this command.")
+        return
+
+    jobs = manager.queue.pending()
+    if not jobs:
+        await update.message.reply_text("ℹ️ No broadcasts are queued.")
+        return
+
+    lines = [
+        f"• {job.job_id} — {time.strftime('%Y-%m-%d %H:%M', time.localtime(job.run_at))}, priority {job.priority}, "
+        f"{Segment.from_dict(job.segment).describe()}"
+        for job in jobs
+    ]
+    await update.message.reply_text("🗓 Queued broadcasts:\n" + "\n".join(lines) + "\n\nRemove one with /unschedule <id>")
+
+async def handle_unschedule(update: Update, context: CallbackContext) -> None:
+    manager = context.bot_data.get('broadcast_manager')
+
+    if not manager:
+        return
+
+    if not manager.is_admin(update.effective_user.id):
+        await update.message.reply_text("⚠️ You are not authorized to use this command.")
+        return
+
+    if not context.args:
+        await update.message.reply_text("Usage: /unschedule <id>")
+        return
+
+    if manager.queue.remove(context.args[0]):
+        await update.message.reply_text(f"✖️ Broadcast {context.args[0]} removed from the queue.")
+    else:
+        await update.message.reply_text(f"❌ No queued broadcast with id {context.args[0]}.")
+
+async def run_due_broadcasts(context: CallbackContext) -> None:
+    """Scheduler tick: starts the next due broadcast if none is running."""
+    manager = context.bot_data.get('broadcast_manager')
+    if manager:
+        manager.start_due_job(context)
+
 def setup_broadcast_handler(application: Application) -> None:
     config = BroadcastConfig()
     config.ADMIN_USER_ID = get_admin_user_id()
@@ -417,3 +1329,23 @@ def setup_broadcast_handler(application: Application) -> None:
     
     # Progress command handler
     application.add_handler(CommandHandler("progress", handle_progress))
+
+    # Resume an interrupted broadcast from its checkpoint
+    application.add_handler(CommandHandler("resume", handle_resume))
+
+    # Controls for the running broadcast
+    application.add_handler(CommandHandler("pause", handle_pause))
+    application.add_handler(CommandHandler("cancel_broadcast", handle_cancel_broadcast))
+
+    # Scheduled broadcasts
+    application.add_handler(CommandHandler("schedule", handle_schedule))
+    application.add_handler(CommandHandler("queue", handle_queue))
+    application.add_handler(CommandHandler("unschedule", handle_unschedule))
+    if application.job_queue:
+        application.job_queue.run_repeating(
+            run_due_broadcasts,
+            interval=manager.config.SCHEDULER_INTERVAL,
+            first=manager.config.SCHEDULER_INTERVAL
+        )
+    else:
+        logger.warning("JobQueue is not available; scheduled broadcasts only start after another broadcast ends.")
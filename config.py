@@ -26,3 +26,31 @@ def get_group_link():
         logger.error("GROUP_LINK environment variable is not set.")
         raise ValueError("GROUP_LINK environment variable is not set.")
     return group_link
+
+def get_flush_interval():
+    """Retrieves the user data flush interval in seconds from environment variables or defaults."""
+    return float(os.getenv("USER_DATA_FLUSH_INTERVAL", "30"))
+
+def get_storage_backend():
+    """Retrieves the user storage backend ("json", "journal" or "sqlite") from environment variables or defaults."""
+    backend = os.getenv("STORAGE_BACKEND", "json").lower()
+    if backend not in ("json", "journal", "sqlite"):
+        logger.error(f"Unknown STORAGE_BACKEND: {backend}")
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    return backend
+
+def get_sqlite_path():
+    """Retrieves the SQLite database path from environment variables or defaults."""
+    return os.getenv("SQLITE_PATH", "users.db")
+
+def get_journal_compact_bytes():
+    """Retrieves the journal size in bytes that triggers compaction from environment variables or defaults."""
+    return int(os.getenv("JOURNAL_COMPACT_BYTES", str(8 * 1024 * 1024)))
+
+def get_storage_max_pending():
+    """Retrieves the maximum number of queued storage operations from environment variables or defaults."""
+    return int(os.getenv("STORAGE_MAX_PENDING", "1000"))
+
+def get_loop_lag_warning():
+    """Retrieves the event loop lag in seconds that triggers a warning from environment variables or defaults."""
+    return float(os.getenv("LOOP_LAG_WARNING", "0.1"))
@@ -1,6 +1,18 @@
+import argparse
+import bisect
+import csv
+import heapq
 import os
 import json
 import logging
+import sys
+import time
+from array import array
+from collections import Counter
+from itertools import islice
+import user_referral_system as urs
+from sqlite_store import SqliteUserStore
+from user_table import UserRecord
 
 logger = logging.getLogger(__name__)
 
@@ -18,4 +30,416 @@ def convert_user_data_if_needed(filename="users_data_converted.json"):
             # File exists, assume data is already in the new format
             logger.info(f"Using existing user data file: {filename}")
     except Exception as e:
-        logger.exception(f"Error in convert_user_data_if_needed: {e}")
\ No newline at end of file
+        logger.exception(f"Error in convert_user_data_if_needed: {e}")
+
+
+def iter_import_records(path):
+    """Streams ``(user_id, username, referred_by)`` records from a CSV or JSONL file.
+
+    CSV files need a header with ``user_id`` and optionally ``username`` and
+    ``referred_by`` columns; JSONL files hold one object with the same keys per line.
+    """
+    with open(path, "r", newline="") as f:
+        if path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for line_number, row in enumerate(rows, start=1):
+            try:
+                user_id = int(row["user_id"])
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Skipping record {line_number}: invalid user_id")
+                continue
+            username = row.get("username") or str(user_id)
+            referred_by = row.get("referred_by") or None
+            yield user_id, username, referred_by
+
+
+def import_users(path, chunk_size=5000):
+    """Registers every user in ``path`` through ``manage_users_batch``, chunk by chunk.
+
+    The file is streamed, so only one chunk is held in memory at a time, and
+    the store is written once at the end. Returns ``(records, new_users)``.
+    """
+    # Imported referrals are historical; keep them off the day/week/month leaderboards.
+    urs.get_store().on_referral = None
+
+    records = iter_import_records(path)
+    total = new_users = 0
+    started = time.monotonic()
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        new_users += sum(urs.manage_users_batch(chunk, persist=False))
+        total += len(chunk)
+        elapsed = time.monotonic() - started
+        logger.info(f"Imported {total} records ({new_users} new) - {total / elapsed if elapsed else 0:.0f} records/sec")
+    urs.flush_all()
+    logger.info(f"Import finished: {total} records, {new_users} new users, {time.monotonic() - started:.1f}s")
+    return total, new_users
+
+
+MIGRATION_FORMATS = ("json", "journal", "sqlite")
+PROGRESS_EVERY = 100000
+SORT_RUN_SIZE = 1 << 20
+
+
+class _JsonStream:
+    """Minimal incremental JSON reader: decodes one value at a time from a file read in blocks."""
+
+    def __init__(self, f, block_size=1 << 20):
+        self._f = f
+        self._block_size = block_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        block = self._f.read(self._block_size)
+        if not block:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + block
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """Skips whitespace and returns the next character, or ``""`` at the end of the file."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in {self._f.name}")
+        self._pos += 1
+
+    def value(self):
+        """Decodes the next complete JSON value, reading more blocks as needed."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A number at the very end of the buffer may continue in the next block.
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+
+def iter_json_users(path, meta=None):
+    """Streams ``(user_id, user)`` pairs from a JSON user data file without loading it whole.
+
+    Top-level keys other than ``users`` (``total_users``, ``journal_seq``) are
+    stored in ``meta`` if given.
+    """
+    with open(path, "r") as f:
+        stream = _JsonStream(f)
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            key = stream.value()
+            stream.expect(":")
+            if key == "users":
+                stream.expect("{")
+                if stream.peek() != "}":
+                    while True:
+                        user_id = stream.value()
+                        stream.expect(":")
+                        yield user_id, stream.value()
+                        if stream.peek() != ",":
+                            break
+                        stream.expect(",")
+                stream.expect("}")
+            else:
+                value = stream.value()
+                if meta is not None:
+                    meta[key] = value
+            if stream.peek() != ",":
+                break
+            stream.expect(",")
+        stream.expect("}")
+
+
+def _read_journal_overlay(journal_path, after_seq):
+    """Folds journal records newer than ``after_seq`` into ``{user_id: (username, referred_by, registered_at, replaces)}``.
+
+    A ``None`` value marks a removed user. ``replaces`` is True when the user was
+    removed and registered again, so the journal entry wins over the snapshot.
+    """
+    overlay = {}
+    try:
+        f = open(journal_path, "r")
+    except FileNotFoundError:
+        return overlay
+    with f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.endswith("\n"):
+                break  # truncated last record
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable journal record {line_number} in {journal_path}")
+                continue
+            if record.get("seq", 0) <= after_seq:
+                continue
+            if record["op"] == "add":
+                user_id = int(record["id"])
+                entry = (record.get("username"), record.get("referred_by"), record.get("registered_at"))
+                if user_id not in overlay:
+                    overlay[user_id] = (*entry, False)
+                elif overlay[user_id] is None:
+                    overlay[user_id] = (*entry, True)
+            elif record["op"] == "remove":
+                for user_id in record["ids"]:
+                    overlay[int(user_id)] = None
+    return overlay
+
+
+def iter_source_records(path, fmt):
+    """Streams raw ``(user_id, username, referred_by, registered_at)`` records from a store in the given format."""
+    if fmt == "sqlite":
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        store = SqliteUserStore(path)
+        try:
+            for chunk in store.iter_user_chunks(chunk_size=10000):
+                for user_id, user in chunk:
+                    yield user_id, user.username, user.referred_by, user.registered_at
+        finally:
+            store.close()
+        return
+
+    if fmt == "json":
+        for user_id, user in iter_json_users(path):
+            yield user_id, user.get("username"), user.get("referred_by"), user.get("registered_at")
+        return
+
+    # Journal: stream the snapshot and apply the (compaction-bounded) journal on top.
+    meta = {}
+    for _ in iter_json_users(path, meta):
+        pass
+    overlay = _read_journal_overlay(f"{path}.journal", meta.get("journal_seq", 0))
+    for user_id, user in iter_json_users(path):
+        entry = overlay.pop(_to_positive_int(user_id), False) if overlay else False
+        if entry is None:
+            continue
+        if entry and entry[3]:
+            yield user_id, *entry[:3]
+        else:
+            yield user_id, user.get("username"), user.get("referred_by"), user.get("registered_at")
+    for user_id, entry in overlay.items():
+        if entry is not None:
+            yield user_id, *entry[:3]
+
+
+def _to_positive_int(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+class _Throughput:
+    """Logs record counts and rates while a migration pass runs."""
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.started = time.monotonic()
+
+    def tick(self):
+        self.count += 1
+        if self.count % PROGRESS_EVERY == 0:
+            self.log()
+
+    def log(self):
+        elapsed = time.monotonic() - self.started
+        logger.info(f"{self.label}: {self.count} records - {self.count / elapsed if elapsed else 0:.0f} records/sec")
+
+
+def _merge_id_runs(runs):
+    """Merges sorted id runs into one ``array('q')`` without duplicates. Returns ``(ids, duplicate_ids)``."""
+    ids = array("q")
+    duplicates = set()
+    for user_id in heapq.merge(*runs):
+        if ids and ids[-1] == user_id:
+            duplicates.add(user_id)
+        else:
+            ids.append(user_id)
+    return ids, duplicates
+
+
+def _remove_destination(path, fmt):
+    suffixes = {"sqlite": ("", "-wal", "-shm"), "journal": ("", ".journal")}.get(fmt, ("",))
+    for suffix in suffixes:
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def migrate(source, destination, source_format="json", destination_format="sqlite", force=False):
+    """Converts a user store between formats by streaming its records three times.
+
+    The first pass validates user ids and collects the sorted id list (8 bytes
+    per user). The second counts the referrals each referrer keeps once
+    duplicates and invalid referrers are dropped. The third writes the
+    destination with ``referral_count`` and ``total_users`` recomputed from
+    ``referred_by``. Invalid records, duplicates, self-referrals and referrers
+    that do not exist are dropped and counted. Returns a dict of statistics.
+    """
+    if source_format not in MIGRATION_FORMATS or destination_format not in MIGRATION_FORMATS:
+        raise ValueError(f"Formats must be one of {', '.join(MIGRATION_FORMATS)}")
+    if os.path.abspath(source) == os.path.abspath(destination):
+        raise ValueError("Source and destination must be different files")
+    if os.path.exists(destination):
+        if not force:
+            raise FileExistsError(f"{destination} already exists; pass --force to replace it")
+        _remove_destination(destination, destination_format)
+
+    stats = Counter()
+    started = time.monotonic()
+
+    # Pass 1: validate ids and find duplicates. Ids are sorted in runs so no
+    # list of Python ints for the whole file is ever built.
+    runs = []
+    run = array("q")
+    progress = _Throughput(f"Scanning {source}")
+    for user_id, _, _, _ in iter_source_records(source, source_format):
+        progress.tick()
+        user_id = _to_positive_int(user_id)
+        if user_id is None:
+            stats["invalid"] += 1
+            continue
+        run.append(user_id)
+        if len(run) >= SORT_RUN_SIZE:
+            runs.append(array("q", sorted(run)))
+            run = array("q")
+    progress.log()
+
+    runs.append(array("q", sorted(run)))
+    ids, duplicates = _merge_id_runs(runs)
+    del runs, run
+
+    def clean_records(stats, label):
+        """Yields the records to write; ``referral_count`` comes from ``referral_counts``."""
+        written_duplicates = set()
+        progress = _Throughput(label)
+        for user_id, username, referred_by, registered_at in iter_source_records(source, source_format):
+            user_id = _to_positive_int(user_id)
+            if user_id is None:
+                continue
+            if user_id in duplicates:
+                if user_id in written_duplicates:
+                    stats["duplicates"] += 1
+                    continue
+                written_duplicates.add(user_id)
+            referrer_id = _to_positive_int(referred_by)
+            if referred_by and referrer_id is None:
+                stats["invalid_referrers"] += 1
+            elif referrer_id == user_id:
+                stats["self_referrals"] += 1
+                referrer_id = None
+            elif referrer_id is not None:
+                position = bisect.bisect_left(ids, referrer_id)
+                if position == len(ids) or ids[position] != referrer_id:
+                    stats["missing_referrers"] += 1
+                    referrer_id = None
+            registered_at = _to_positive_int(registered_at)
+            progress.tick()
+            yield user_id, username or str(user_id), referral_counts.get(user_id, 0), referrer_id, registered_at
+        progress.log()
+
+    # Pass 2: count the referrals of the records that will be written, so
+    # dropped duplicates and referrers do not credit anyone.
+    referral_counts = Counter()
+    for _, _, _, referrer_id, _ in clean_records(Counter(), f"Counting referrals in {source}"):
+        if referrer_id is not None:
+            referral_counts[referrer_id] += 1
+
+    # Pass 3: write the destination with the recomputed counts.
+    records = clean_records(stats, f"Writing {destination}")
+    if destination_format == "sqlite":
+        store = SqliteUserStore(destination)
+        conn = store.load()
+        if conn is None:
+            raise OSError(f"Could not open {destination}")
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO users (user_id, username, referral_count, referred_by, registered_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    records
+                )
+                total = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'total_users'", (total,))
+        finally:
+            store.close()
+    else:
+        extra = {"total_users": len(ids)}
+        if destination_format == "journal":
+            extra["journal_seq"] = 0
+        users = (
+            (user_id, UserRecord(*record))
+            for user_id, *record in records
+        )
+        total = urs.write_user_file(destination, users, extra)
+        if destination_format == "journal":
+            open(f"{destination}.journal", "w").close()
+
+    stats["users"] = total
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Migrated {source} ({source_format}) to {destination} ({destination_format}): {total} users in {elapsed:.1f}s "
+        f"({total / elapsed if elapsed else 0:.0f} users/sec); dropped {stats['invalid']} invalid records and "
+        f"{stats['duplicates']} duplicates; cleared {stats['self_referrals']} self-referrals, "
+        f"{stats['missing_referrers']} missing and {stats['invalid_referrers']} invalid referrers"
+    )
+    return dict(stats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="User data maintenance tools. Stop the bot before running them.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Bulk-register users from a CSV or JSONL file.")
+    import_parser.add_argument("path", help="CSV (user_id,username,referred_by) or JSONL file")
+    import_parser.add_argument("--chunk-size", type=int, default=5000, help="Records applied per batch")
+
+    migrate_parser = subparsers.add_parser("migrate", help="Convert user data between storage formats.")
+    migrate_parser.add_argument("source", help="Source file (JSON data file, journal snapshot or SQLite database)")
+    migrate_parser.add_argument("destination", help="Destination file")
+    migrate_parser.add_argument("--from", dest="source_format", choices=MIGRATION_FORMATS, default="json")
+    migrate_parser.add_argument("--to", dest="destination_format", choices=MIGRATION_FORMATS, default="sqlite")
+    migrate_parser.add_argument("--force", action="store_true", help="Replace the destination if it exists")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    if args.command == "import":
+        import_users(args.path, chunk_size=args.chunk_size)
+    elif args.command == "migrate":
+        try:
+            migrate(args.source, args.destination, args.source_format, args.destination_format, force=args.force)
+        except (OSError, ValueError) as e:
+            logger.error(f"Migration failed: {e}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+Simulated Telegram backend for benchmarking broadcasts offline.
+
+:class:`FakeBot` stands in for ``context.bot`` (and :class:`FakeMessage` for
+the admin's ``Message``). Requests take a configurable latency, every user in
+a configurable fraction is treated as having blocked the bot (``Forbidden``),
+and once more than ``rate_limit`` messages are sent within one second the bot
+answers ``RetryAfter`` and keeps doing so until the flood wait is over, as
+Telegram does.
+
+The driver registers N synthetic users in a throw-away data directory, runs
+:meth:`broadcast.BroadcastManager.broadcast_messages` against the fake bot
+and reports the achieved throughput:
+
+    python fake_bot.py --users 2000 --latency lognormal:0.08,0.4 --rate-limit 30
+
+Runs are repeatable for a given ``--seed``. They happen in real time, so a
+broadcast to N users takes at least N / rate_limit seconds.
+
+With ``--config PROCESS_COUNT=N`` every worker process gets its own fake bot
+enforcing 1/N of ``--rate-limit``, and the backend counters only cover the
+parent process.
+"""
+import argparse
+import asyncio
+import collections
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from telegram.error import Forbidden, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+def parse_latency(spec, rng):
+    """Returns a function drawing request latencies (seconds) from ``spec``.
+
+    ``constant:S``, ``uniform:LOW,HIGH`` or ``lognormal:MEDIAN,SIGMA``.
+    """
+    model, _, args = spec.partition(":")
+    try:
+        values = [float(value) for value in args.split(",")] if args else []
+    except ValueError:
+        values = None
+    if model == "constant" and values and len(values) == 1:
+        return lambda: values[0]
+    if model == "uniform" and values and len(values) == 2:
+        return lambda: rng.uniform(*values)
+    if model == "lognormal" and values and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Invalid latency {spec!r}; use constant:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+
+
+class FakeBot:
+    """Async stand-in for ``telegram.Bot`` covering the calls a broadcast makes."""
+
+    def __init__(
+        self,
+        latency="lognormal:0.08,0.4",
+        rate_limit=30.0,
+        retry_after=1,
+        forbidden_rate=0.0,
+        seed=0
+    ):
+        self.rng = random.Random(seed)
+        self.latency = latency
+        self.draw_latency = parse_latency(latency, self.rng)
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.forbidden_rate = forbidden_rate
+        self.seed = seed
+        self.username = "fake_bot"
+        self.stats = collections.Counter()
+        self.admin_messages = []
+        self._recent = collections.deque()
+        self._flood_until = 0.0
+        self._message_ids = itertools.count(1)
+
+    def is_forbidden(self, chat_id):
+        """Deterministic per user, so retries and reruns with one seed agree."""
+        return random.Random(chat_id * 1000003 + self.seed).random() < self.forbidden_rate
+
+    def _check_flood(self):
+        now = time.monotonic()
+        if now < self._flood_until:
+            raise RetryAfter(max(1, round(self._flood_until - now)))
+        while self._recent and now - self._recent[0] >= 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate_limit:
+            self._flood_until = now + self.retry_after
+            raise RetryAfter(self.retry_after)
+        self._recent.append(now)
+
+    def _message(self, chat_id):
+        return SimpleNamespace(message_id=next(self._message_ids), chat_id=chat_id)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, reply_markup=None, **kwargs):
+        self.stats["requests"] += 1
+        await asyncio.sleep(self.draw_latency())
+        try:
+            self._check_flood()
+        except RetryAfter:
+            self.stats["retry_after"] += 1
+            raise
+        if self.is_forbidden(chat_id):
+            self.stats["forbidden"] += 1
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        self.stats["delivered"] += 1
+        return self._message(chat_id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.admin_messages.append(text)
+        return self._message(chat_id)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.admin_messages.append(text)
+        return self._message(chat_id)
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        return True
+
+    async def unpin_chat_message(self, chat_id, message_id=None, **kwargs):
+        return True
+
+
+class FakeMessage:
+    """Stand-in for the admin's ``Message``: enough for previews and broadcasts."""
+
+    def __init__(self, bot, chat_id, message_id=1):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def copy(self, chat_id, reply_markup=None, **kwargs):
+        return await self.bot.copy_message(chat_id, self.chat_id, self.message_id, reply_markup=reply_markup)
+
+
+async def _run(bot, users, config_overrides, buttons):
+    # Imported here: the data directory must be set before these modules load.
+    import user_referral_system as urs
+    from broadcast import BroadcastConfig, BroadcastManager
+
+    urs.manage_users_batch(((user_id, f"user{user_id}", None) for user_id in range(1, users + 1)), persist=False)
+
+    config = BroadcastConfig(ADMIN_USER_ID=0, **config_overrides)
+    manager = BroadcastManager(config)
+    if config.PROCESS_COUNT > 1:
+        manager.bot_factory = functools.partial(
+            FakeBot, bot.latency, bot.rate_limit / config.PROCESS_COUNT, bot.retry_after, bot.forbidden_rate, bot.seed
+        )
+    context = SimpleNamespace(bot=bot, bot_data={"broadcast_manager": manager}, job_queue=None)
+    started = time.monotonic()
+    await manager.broadcast_messages(context, FakeMessage(bot, config.ADMIN_USER_ID), buttons)
+    elapsed = time.monotonic() - started
+
+    return {
+        "users": users,
+        "elapsed": elapsed,
+        "messages_sent": manager.state.messages_sent,
+        "users_blocked": manager.state.users_blocked,
+        "throughput": manager.state.messages_sent / elapsed if elapsed else 0.0,
+        "final_rate_limit": manager.rate_controller.rate if manager.rate_controller else None,
+        "rate_decreases": manager.rate_controller.decreases if manager.rate_controller else 0,
+        "backend": dict(bot.stats),
+        "metrics": manager.metrics.to_dict(),
+    }
+
+
+def run_benchmark(bot, users, config_overrides=None, buttons=None, data_dir=None):
+    """Runs one broadcast to ``users`` synthetic users against ``bot`` and returns its statistics.
+
+    User data, snapshots, checkpoints and reports go to ``data_dir`` (a new
+    temporary directory, removed afterwards, by default). Call it once per
+    process: the user store and reachability registry are process-wide.
+    """
+    directory = data_dir or tempfile.mkdtemp(prefix="broadcast-bench-")
+    os.environ["STORAGE_BACKEND"] = "json"
+    os.environ.setdefault("ADMIN_USER_ID", "0")
+    import user_referral_system as urs
+    urs.DEFAULT_FILENAME = os.path.join(directory, "users.json")
+    try:
+        result = asyncio.run(_run(bot, users, config_overrides or {}, buttons))
+        # Flush now so nothing is left for the exit hooks to write into a removed directory.
+        import reachability
+        urs.flush_all()
+        reachability.flush()
+        return result
+    finally:
+        if data_dir is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark a broadcast against a simulated Telegram backend.")
+    parser.add_argument("--users", type=int, default=1000, help="Number of synthetic recipients")
+    parser.add_argument("--latency", default="lognormal:0.08,0.4", help="constant:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--rate-limit", type=float, default=30.0, help="Messages per second before RetryAfter")
+    parser.add_argument("--retry-after", type=int, default=1, help="Flood wait in seconds returned with RetryAfter")
+    parser.add_argument("--forbidden-rate", type=float, default=0.05, help="Fraction of users that blocked the bot")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--buttons", action="store_true", help="Attach an inline keyboard to the broadcast")
+    parser.add_argument("--data-dir", help="Keep user data, snapshots and the report in this directory")
+    parser.add_argument("--json", action="store_true", help="Print the full result as JSON")
+    parser.add_argument(
+        "--config", action="append", default=[], metavar="NAME=VALUE",
+        help="BroadcastConfig override, e.g. --config WORKER_COUNT=16 --config MAX_MESSAGES_PER_SECOND=28"
+    )
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for item in args.config:
+        name, _, value = item.partition("=")
+        try:
+            overrides[name.upper()] = float(value) if "." in value else int(value)
+        except ValueError:
+            parser.error(f"Invalid --config {item!r}")
+    try:
+        bot = FakeBot(args.latency, args.rate_limit, args.retry_after, args.forbidden_rate, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+    buttons = ["Open", "https://example.com"] if args.buttons else None
+    result = run_benchmark(bot, args.users, overrides, buttons, args.data_dir)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    latency = result["metrics"]["latency"]
+    print(
+        f"{result['messages_sent']} sent, {result['users_blocked']} blocked of {result['users']} users "
+        f"in {result['elapsed']:.1f}s: {result['throughput']:.1f} messages/sec\n"
+        f"Backend: {result['backend'].get('requests', 0)} requests, "
+        f"{result['backend'].get('retry_after', 0)} RetryAfter, {result['backend'].get('forbidden', 0)} Forbidden\n"
+        f"Rate limit: {result['final_rate_limit']:.1f} messages/sec at the end, cut {result['rate_decreases']} times\n"
+        f"Latency p50/p95/p99: {latency['p50'] * 1000:.0f} / {latency['p95'] * 1000:.0f} / {latency['p99'] * 1000:.0f} ms"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
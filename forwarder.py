@@ -1,6 +1,7 @@
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
+import reachability
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,9 @@ async def forward_to_admin(update: Update, context: ContextTypes.DEFAULT_TYPE, a
         if user_id == admin_user_id:
             return
 
+        # Anyone writing to the bot can be reached again
+        reachability.mark_reachable(user_id)
+
         # Prepare user info with proper formatting
         user_info = (
             f"👤 User Information:\n"
@@ -197,6 +201,9 @@ async def send_reply_to_user(update: Update, context: ContextTypes.DEFAULT_TYPE)
     """Sends the admin's reply to the user."""
     try:
         user_id = context.user_data.pop("replying_to", None)
+        if user_id and reachability.is_unreachable(user_id):
+            await update.message.reply_text("❌ This user has blocked the bot or deleted their account.")
+            return ConversationHandler.END
         if user_id:
             reply_text = update.message.text
             await context.bot.send_message(
@@ -209,6 +216,9 @@ async def send_reply_to_user(update: Update, context: ContextTypes.DEFAULT_TYPE)
             await update.message.reply_text("❌ No user to reply to.")
             return ConversationHandler.END
     except Exception as e:
+        if reachability.record_error(user_id, e):
+            await update.message.reply_text("❌ This user has blocked the bot or deleted their account.")
+            return ConversationHandler.END
         logger.exception(f"Error sending reply to user: {e}")
         await update.message.reply_text("❌ Failed to send reply. Please try again.")
         return ConversationHandler.END
@@ -5,6 +5,7 @@ from telegram.ext import ContextTypes
 import user_referral_system as urs
 from datetime import timedelta
 from config import get_admin_user_id, get_group_link
+import reachability
 from forwarder import forward_to_admin, reply_callback, send_reply_to_user, REPLYING, cancel
 
 
@@ -16,12 +17,11 @@ This module contains various handlers for different events in the Telegram bot.
 
 async def handle_referral(context: ContextTypes.DEFAULT_TYPE, user_id: int, username: str, referral_code: str):
     """Handles the referral logic."""
-    data = urs.load_data()
-    if data is None:
+    if not await urs.is_available_async():
         await context.bot.send_message(chat_id=user_id, text="An error occurred while loading user data. Please try again later.")
         return False
 
-    is_new_user = urs.manage_user(user_id, username, referred_by=referral_code)
+    is_new_user = await urs.manage_user_async(user_id, username, referred_by=referral_code)
 
     if referral_code:
         referrer_id = int(referral_code)
@@ -49,7 +49,7 @@ async def send_welcome_message(update: Update, context: ContextTypes.DEFAULT_TYP
 async def notify_admin(context: ContextTypes.DEFAULT_TYPE, username:str, is_new_user: bool):
     """Notifies the admin about a new user."""
     if is_new_user:
-        total_users = urs.get_total_user_count()
+        total_users = await urs.get_total_user_count_async()
         admin_message = f"🆕 New User!\nTotal: {total_users}\nName: {username}"
         try:
             await context.bot.send_message(chat_id=get_admin_user_id(), text=admin_message)
@@ -68,6 +68,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /start command logic."""
     try:
         user_id = update.effective_user.id
+        reachability.mark_reachable(user_id)
         username = update.effective_user.username or update.effective_user.first_name or str(user_id)
         bot_link = f"https://t.me/{context.bot.username}"
         ref_link = f"{bot_link}?start={user_id}"
@@ -87,8 +88,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def inform_referrer_on_new_referral(context: ContextTypes.DEFAULT_TYPE, referrer_id: int):
     """Informs the referrer when someone joins using their link."""
+    if reachability.is_unreachable(referrer_id):
+        return
     try:
-        referral_count = urs.get_referral_count(referrer_id)
+        referral_count = await urs.get_referral_count_async(referrer_id)
         if referral_count < 3:
             await context.bot.send_message(
                 chat_id=referrer_id,
@@ -107,7 +110,8 @@ async def inform_referrer_on_new_referral(context: ContextTypes.DEFAULT_TYPE, re
         # No message sent if referral_count > 3
 
     except Exception as e:
-        logger.exception(f"Error informing referrer: {e}")
+        if not reachability.record_error(referrer_id, e):
+            logger.exception(f"Error informing referrer: {e}")
 
 async def check_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the check_referrals callback query (button press)."""
@@ -125,7 +129,7 @@ async def check_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def check_and_send_referral_message(context: ContextTypes.DEFAULT_TYPE, user_id: int):
     """Checks referral count and sends message if the threshold is met (for button press)."""
     try:
-        referral_count = urs.get_referral_count(user_id)
+        referral_count = await urs.get_referral_count_async(user_id)
         if referral_count >= 3:
             group_link = get_group_link()
             group_title = "👉 Language Group 👈"
@@ -148,7 +152,8 @@ async def check_and_send_referral_message(context: ContextTypes.DEFAULT_TYPE, us
                 disable_web_page_preview=True
             )
     except Exception as e:
-        logger.exception(f"Error in check_and_send_referral_message: {e}")
+        if not reachability.record_error(user_id, e):
+            logger.exception(f"Error in check_and_send_referral_message: {e}")
 
 async def check_referral_timeout(context: ContextTypes.DEFAULT_TYPE):
     """Checks if a user has met the referral target after the specified time."""
@@ -157,8 +162,10 @@ async def check_referral_timeout(context: ContextTypes.DEFAULT_TYPE):
         data = job.data
         user_id = data['user_id']
         chat_id = data['chat_id']
+        if reachability.is_unreachable(chat_id):
+            return
 
-        referral_count = urs.get_referral_count(user_id)
+        referral_count = await urs.get_referral_count_async(user_id)
         if referral_count < 3:
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -168,7 +175,8 @@ async def check_referral_timeout(context: ContextTypes.DEFAULT_TYPE):
                 disable_web_page_preview=True
             )
     except Exception as e:
-        logger.exception(f"Error sending referral timeout message: {e}")
+        if not reachability.record_error(chat_id, e):
+            logger.exception(f"Error sending referral timeout message: {e}")
 async def forward_to_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Forwards user messages to the admin with a reply button."""
     admin_user_id = get_admin_user_id()
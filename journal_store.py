@@ -0,0 +1,188 @@
+"""
+Append-only journal backend for the user referral system.
+
+Each mutation is appended as one JSON line to ``<data file>.journal`` instead of
+rewriting the whole data file. On startup the last snapshot is loaded and the
+journal is replayed on top of it. Once the journal grows past a size threshold,
+:meth:`JournalUserStore.flush` folds it into a fresh snapshot.
+"""
+import json
+import logging
+import os
+import time
+
+from user_referral_system import UserStore
+
+logger = logging.getLogger(__name__)
+
+
+class JournalUserStore(UserStore):
+    """In-memory user store that persists mutations through an append-only journal.
+
+    Every record carries a sequence number and the snapshot stores the last
+    sequence number it contains, so records that were already folded into the
+    snapshot are skipped when a crash happens between compaction steps. A
+    truncated last line (crash mid-append) is dropped.
+    """
+
+    def __init__(self, filename, journal_filename=None, compact_threshold=8 * 1024 * 1024):
+        super().__init__(filename)
+        self.journal_filename = journal_filename or f"{filename}.journal"
+        self.compact_threshold = compact_threshold
+        self._journal = None
+        self._seq = 0
+
+    def load(self):
+        """Loads the snapshot and replays the journal if that has not happened yet."""
+        with self._lock:
+            if self._data is None:
+                data = super().load()
+                if data is None:
+                    return None
+                self._seq = data.pop("journal_seq", 0)
+                # Replayed referrals were already counted when they happened
+                on_referral, self.on_referral = self.on_referral, None
+                try:
+                    self._replay()
+                finally:
+                    self.on_referral = on_referral
+                self._dirty = False
+                self._journal = open(self.journal_filename, "a")
+            return self._data
+
+    def _replay(self):
+        try:
+            with open(self.journal_filename, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return
+
+        # A crash mid-append leaves a partial last line; cut it off so the
+        # next append starts on a fresh line.
+        complete_length = content.rfind(b"\n") + 1
+        if complete_length < len(content):
+            logger.warning(f"Dropping truncated last record in {self.journal_filename}")
+            with open(self.journal_filename, "r+b") as f:
+                f.truncate(complete_length)
+
+        replayed = 0
+        for line_number, line in enumerate(content[:complete_length].splitlines(), start=1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable journal record {line_number} in {self.journal_filename}")
+                continue
+            if record["seq"] <= self._seq:
+                continue
+            self._apply(record)
+            self._seq = record["seq"]
+            replayed += 1
+        if replayed:
+            logger.info(f"Replayed {replayed} journal records from {self.journal_filename}")
+
+    def _apply(self, record):
+        if record["op"] == "add":
+            # Records journaled before registration times were stored replay
+            # as unknown (0), not as registered at replay time.
+            UserStore.manage_user(
+                self,
+                record["id"],
+                record["username"],
+                referred_by=record.get("referred_by"),
+                registered_at=record.get("registered_at", 0)
+            )
+        elif record["op"] == "remove":
+            UserStore.remove_users(self, record["ids"])
+        else:
+            logger.warning(f"Unknown journal operation: {record['op']}")
+
+    def _append(self, *records):
+        lines = []
+        for record in records:
+            self._seq += 1
+            record["seq"] = self._seq
+            lines.append(json.dumps(record, separators=(",", ":")) + "\n")
+        self._journal.write("".join(lines))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def manage_user(self, user_id, username, referred_by=None):
+        """Manages user data and referral counts. Returns True if this is a new user."""
+        return self.manage_users_batch([(user_id, username, referred_by)])[0]
+
+    def manage_users_batch(self, records):
+        """Applies registrations in order and journals the new ones with a single fsync."""
+        with self._lock:
+            if self.load() is None:
+                return [False] * len(records)
+            results = []
+            journal_records = []
+            registered_at = int(time.time())
+            for user_id, username, referred_by in records:
+                is_new_user = UserStore.manage_user(
+                    self, user_id, username, referred_by=referred_by, registered_at=registered_at
+                )
+                if is_new_user:
+                    # Journal the referrer that was credited (None if it did
+                    # not exist yet), so readers need not replay the rule.
+                    journal_records.append({
+                        "op": "add",
+                        "id": int(user_id),
+                        "username": username,
+                        "referred_by": self._data["users"].get(user_id).referred_by,
+                        "registered_at": registered_at
+                    })
+                results.append(is_new_user)
+            if journal_records:
+                try:
+                    self._append(*journal_records)
+                except OSError as e:
+                    logger.exception(f"Error writing {len(journal_records)} journal records: {e}")
+            return results
+
+    def remove_users(self, user_ids):
+        """Removes the given users. Returns the number of users actually removed."""
+        with self._lock:
+            if self.load() is None:
+                return 0
+            user_ids = [int(user_id) for user_id in user_ids]
+            removed = super().remove_users(user_ids)
+            if removed:
+                try:
+                    self._append({"op": "remove", "ids": user_ids})
+                except OSError as e:
+                    logger.exception(f"Error writing journal record for removed users: {e}")
+            return removed
+
+    def save_data(self, data):
+        """Replaces the user data and writes a fresh snapshot right away."""
+        with self._lock:
+            if self.load() is None:
+                return
+            super().save_data(data)
+            try:
+                self._compact()
+            except OSError as e:
+                logger.exception(f"Error saving data: {e}")
+
+    def _write_snapshot(self, data):
+        super()._write_snapshot({**data, "journal_seq": self._seq})
+
+    def _compact(self):
+        self._write_snapshot(self._data)
+        self._journal.close()
+        self._journal = open(self.journal_filename, "w")
+        self._dirty = False
+        logger.info(f"Compacted {self.journal_filename} into {self.filename} at sequence {self._seq}")
+
+    def flush(self):
+        """Compacts the journal once it passes the size threshold. Returns True if it did."""
+        with self._lock:
+            if self._journal is None or os.fstat(self._journal.fileno()).st_size < self.compact_threshold:
+                return False
+            try:
+                self._compact()
+            except OSError as e:
+                logger.exception(f"Error compacting journal: {e}")
+                return False
+            return True
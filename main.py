@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -12,13 +13,21 @@ from telegram.ext import (
     filters,
     ConversationHandler,
 )
-from config import get_bot_token, get_admin_user_id, get_group_link
+from config import get_bot_token, get_admin_user_id, get_group_link, get_flush_interval
+import reachability
 from broadcast import setup_broadcast_handler
+from referrals import referrals
+from top import top
 from user_referral_system import (
-    load_data,
-    manage_user,
-    get_referral_count,
-    get_total_user_count,
+    is_available_async,
+    manage_user_async,
+    get_storage_stats,
+    get_referral_count_async,
+    get_total_user_count_async,
+    flush_all_async,
+    monitor_loop_lag,
+    start_writer,
+    stop_writer,
 )
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
@@ -31,10 +40,14 @@ REPLYING = 0
 # Dictionary to store pending replies (key: admin message ID, value: user ID)
 pending_replies = {}
 
+# Long-running tasks started at startup and cancelled at shutdown
+background_tasks = []
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /start command logic."""
     try:
         user_id = update.effective_user.id
+        reachability.mark_reachable(user_id)
         username = update.effective_user.username or update.effective_user.first_name or str(user_id)
         bot_link = f"https://t.me/{context.bot.username}"
         ref_link = f"{bot_link}?start={user_id}"
@@ -53,12 +66,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_referral(context: ContextTypes.DEFAULT_TYPE, user_id: int, username: str, referral_code: str):
     """Handles the referral logic."""
-    data = load_data()
-    if data is None:
+    if not await is_available_async():
         await context.bot.send_message(chat_id=user_id, text="An error occurred while loading user data. Please try again later.")
         return False
 
-    is_new_user = manage_user(user_id, username, referred_by=referral_code)
+    is_new_user = await manage_user_async(user_id, username, referred_by=referral_code)
 
     if referral_code:
         referrer_id = int(referral_code)
@@ -86,7 +98,7 @@ async def send_welcome_message(update: Update, context: ContextTypes.DEFAULT_TYP
 async def notify_admin(context: ContextTypes.DEFAULT_TYPE, username:str, is_new_user: bool):
     """Notifies the admin about a new user."""
     if is_new_user:
-        total_users = get_total_user_count()
+        total_users = await get_total_user_count_async()
         admin_message = f"🆕 New User!\nTotal: {total_users}\nName: {username}"
         try:
             await context.bot.send_message(chat_id=get_admin_user_id(), text=admin_message)
@@ -104,8 +116,10 @@ async def schedule_referral_check(context: ContextTypes.DEFAULT_TYPE, user_id: i
 
 async def inform_referrer_on_new_referral(context: ContextTypes.DEFAULT_TYPE, referrer_id: int):
     """Informs the referrer when someone joins using their link."""
+    if reachability.is_unreachable(referrer_id):
+        return
     try:
-        referral_count = get_referral_count(referrer_id)
+        referral_count = await get_referral_count_async(referrer_id)
         if referral_count < 3:
             await context.bot.send_message(
                 chat_id=referrer_id,
@@ -124,7 +138,8 @@ async def inform_referrer_on_new_referral(context: ContextTypes.DEFAULT_TYPE, re
         # No message sent if referral_count > 3
 
     except Exception as e:
-        logger.exception(f"Error informing referrer: {e}")
+        if not reachability.record_error(referrer_id, e):
+            logger.exception(f"Error informing referrer: {e}")
 
 async def check_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the check_referrals callback query (button press)."""
@@ -142,7 +157,7 @@ async def check_referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def check_and_send_referral_message(context: ContextTypes.DEFAULT_TYPE, user_id: int):
     """Checks referral count and sends message if the threshold is met (for button press)."""
     try:
-        referral_count = get_referral_count(user_id)
+        referral_count = await get_referral_count_async(user_id)
         if referral_count >= 3:
             group_link = get_group_link()
             group_title = "👉 Language Group 👈"
@@ -165,7 +180,8 @@ async def check_and_send_referral_message(context: ContextTypes.DEFAULT_TYPE, us
                 disable_web_page_preview=True
             )
     except Exception as e:
-        logger.exception(f"Error in check_and_send_referral_message: {e}")
+        if not reachability.record_error(user_id, e):
+            logger.exception(f"Error in check_and_send_referral_message: {e}")
 
 async def check_referral_timeout(context: ContextTypes.DEFAULT_TYPE):
     """Checks if a user has met the referral target after the specified time."""
@@ -174,8 +190,10 @@ async def check_referral_timeout(context: ContextTypes.DEFAULT_TYPE):
         data = job.data
         user_id = data['user_id']
         chat_id = data['chat_id']
+        if reachability.is_unreachable(chat_id):
+            return
 
-        referral_count = get_referral_count(user_id)
+        referral_count = await get_referral_count_async(user_id)
         if referral_count < 3:
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -185,7 +203,8 @@ async def check_referral_timeout(context: ContextTypes.DEFAULT_TYPE):
                 disable_web_page_preview=True
             )
     except Exception as e:
-        logger.exception(f"Error sending referral timeout message: {e}")
+        if not reachability.record_error(chat_id, e):
+            logger.exception(f"Error sending referral timeout message: {e}")
 
 async def forward_to_admin_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Forwards user messages to the admin with a reply button."""
@@ -204,61 +223,51 @@ async def cancel_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Cancels the reply conversation."""
     return await cancel(update, context)
 
-async def top(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles the /top command to display the top 10 users with the most referrals."""
-    user_id = update.effective_user.id
-    if user_id != get_admin_user_id():
-        await update.message.reply_text("🚫 You are not authorized to use this command.")
-        return
+def log_storage_stats():
+    """Logs the storage queue, write batching and event loop lag counters."""
+    stats = get_storage_stats()
+    logger.info(
+        f"Storage: {stats['operations']} operations, {stats['pending']} pending "
+        f"(max {stats['max_pending']}), max operation {stats['max_storage_seconds'] * 1000:.0f} ms, "
+        f"{stats['batched_writes']} writes in {stats['write_batches']} batches "
+        f"(max {stats['max_write_batch']}), max loop lag {stats['max_loop_lag_seconds'] * 1000:.0f} ms"
+    )
 
-    # Load data from user_data_converted.json
+async def flush_user_data(context: ContextTypes.DEFAULT_TYPE):
+    """Periodically writes pending user data changes to disk and logs the storage counters."""
     try:
-        with open('users_data_converted.json', 'r') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        await update.message.reply_text("❌ Data file not found. Please check the file path.")
-        return
-    except json.JSONDecodeError:
-        await update.message.reply_text("❌ Invalid data file. Please check the file format.")
-        return
-
-    users = data.get('users', {})
-
-    # Extract users with referral_count > 0
-    users_with_referrals = [
-        (user_info.get('username', 'Unknown User'), user_info['referral_count'])
-        for user_info in users.values()
-        if 'referral_count' in user_info and user_info['referral_count'] > 0
-    ]
-
-    # Sort users by referral_count in descending order
-    sorted_users = sorted(users_with_referrals, key=lambda x: x[1], reverse=True)
-
-    # Get top 10 users
-    top_users = sorted_users[:10]
-
-    # Prepare the message with emojis and formatting
-    if not top_users:
-        message = "📊 No users have made referrals yet."
+        await flush_all_async()
+        await asyncio.get_running_loop().run_in_executor(None, reachability.flush)
+        log_storage_stats()
+    except Exception as e:
+        logger.exception(f"Error flushing user data: {e}")
+
+async def on_startup(application):
+    """Loads the user data once and schedules the write-behind flush."""
+    await is_available_async()
+    log_storage_stats()
+    start_writer()
+    background_tasks.append(asyncio.create_task(monitor_loop_lag()))
+    if application.job_queue:
+        interval = get_flush_interval()
+        application.job_queue.run_repeating(flush_user_data, interval=interval, first=interval)
     else:
-        message = "🏆 *Top 10 Users with the Most Referrals* 🏆\n\n"
-        for rank, (username, count) in enumerate(top_users, start=1):
-            # Add emojis based on rank
-            if rank == 1:
-                medal = "🥇"
-            elif rank == 2:
-                medal = "🥈"
-            elif rank == 3:
-                medal = "🥉"
-            else:
-                medal = "🔹"
-
-            message += f"{medal} *{rank}. {username}* - {count}\n"
-
-        message += "\n🎉 Keep up the great work! 🎉"
-
-    # Send the formatted message
-    await update.message.reply_text(message, parse_mode="Markdown")
+        logger.warning("JobQueue is not available; user data is only flushed at shutdown.")
+
+async def on_stop(application):
+    """Stops the running broadcast and background tasks while the bot can still make requests."""
+    manager = application.bot_data.get('broadcast_manager')
+    if manager:
+        # A running broadcast is stopped with its checkpoint kept for /resume.
+        await manager.shutdown()
+    while background_tasks:
+        background_tasks.pop().cancel()
+
+async def on_shutdown(application):
+    """Writes any pending user data changes before the process exits."""
+    await stop_writer()
+    await flush_all_async()
+    reachability.flush()
 
 def main():
     try:
@@ -271,6 +280,9 @@ def main():
             .token(token)
             .persistence(persistence)
             .concurrent_updates(True)
+            .post_init(on_startup)
+            .post_stop(on_stop)
+            .post_shutdown(on_shutdown)
             .build()
         )
 
@@ -278,6 +290,7 @@ def main():
         application.add_handler(CommandHandler("start", start))
         application.add_handler(CallbackQueryHandler(check_referrals, pattern="^check_referrals$"))
         application.add_handler(CommandHandler("top", top))  # Add the /top handler
+        application.add_handler(CommandHandler("referrals", referrals))
 
         # Conversation handler for admin replies
         conv_handler = ConversationHandler(
@@ -0,0 +1,214 @@
+"""
+Token-bucket rate limiting for outgoing Telegram requests.
+
+Tokens are added continuously at ``rate`` per second up to ``capacity``; each
+request takes one token and waits when none is left. Waiters are served in
+arrival order, so concurrent senders share the rate fairly and the total never
+exceeds the target, however many of them there are.
+
+:class:`SharedTokenBucket` keeps the same state in shared memory so several
+worker processes draw from one rate budget.
+
+:class:`AdaptiveRateController` moves a bucket's rate with AIMD: it creeps up
+while requests succeed and is cut by a factor when Telegram pushes back.
+"""
+import asyncio
+import multiprocessing
+import time
+
+
+class TokenBucket:
+    """Async token bucket allowing ``rate`` acquisitions per second on average."""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        # Total time acquisitions were held back by pause()
+        self.paused_seconds = 0.0
+        self._last_decrease = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float) -> None:
+        """Changes the refill rate; tokens earned so far are kept."""
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self._refill()
+        self.rate = rate
+
+    def increase_rate(self, step: float, max_rate: float) -> None:
+        """Additive increase: adds ``step / rate``, capped at ``max_rate``."""
+        self.set_rate(min(max_rate, self.rate + step / self.rate))
+
+    def decrease_rate(self, factor: float, min_rate: float, cooldown: float) -> bool:
+        """Multiplicative decrease, at most once per ``cooldown`` seconds. Returns True if the rate was cut."""
+        now = time.monotonic()
+        if now - self._last_decrease < cooldown:
+            return False
+        self._last_decrease = now
+        self.set_rate(max(min_rate, self.rate * factor))
+        return True
+
+    def pause(self, seconds: float) -> None:
+        """Hands out no tokens for the next ``seconds`` seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> float:
+        """Waits for a token. Returns the number of seconds spent waiting."""
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                paused = self._paused_until - time.monotonic()
+                if paused > 0:
+                    await asyncio.sleep(paused)
+                    self.paused_seconds += paused
+                    self._tokens = 0.0
+                    self._updated = time.monotonic()
+                    continue
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return time.monotonic() - started
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class SharedTokenBucket:
+    """:class:`TokenBucket` whose state lives in shared memory.
+
+    Create it in the parent and pass it to worker processes as a ``Process``
+    argument; every process then draws from the same budget, and pauses and
+    rate changes made by one apply to all. ``time.monotonic`` is system-wide,
+    so timestamps agree between processes. Waiters in different processes
+    are not served in strict arrival order.
+    """
+
+    _TOKENS, _UPDATED, _RATE, _PAUSED_UNTIL, _PAUSED_SECONDS, _LAST_DECREASE = range(6)
+
+    def __init__(self, rate: float, capacity: float = 1.0, context=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        context = context or multiprocessing.get_context("spawn")
+        self.capacity = capacity
+        self._state = context.RawArray("d", 6)
+        self._lock = context.Lock()
+        self._state[self._TOKENS] = capacity
+        self._state[self._UPDATED] = time.monotonic()
+        self._state[self._RATE] = rate
+        self._state[self._LAST_DECREASE] = float("-inf")
+
+    @property
+    def rate(self) -> float:
+        return self._state[self._RATE]
+
+    @property
+    def paused_seconds(self) -> float:
+        return self._state[self._PAUSED_SECONDS]
+
+    def _refill(self, now: float) -> None:
+        # Call with the lock held. Nothing accrues while paused.
+        state = self._state
+        start = max(state[self._UPDATED], state[self._PAUSED_UNTIL])
+        if start < now:
+            state[self._TOKENS] = min(self.capacity, state[self._TOKENS] + (now - start) * state[self._RATE])
+        state[self._UPDATED] = now
+
+    def set_rate(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        with self._lock:
+            self._refill(time.monotonic())
+            self._state[self._RATE] = rate
+
+    def increase_rate(self, step: float, max_rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            rate = self._state[self._RATE]
+            self._state[self._RATE] = min(max_rate, rate + step / rate)
+
+    def decrease_rate(self, factor: float, min_rate: float, cooldown: float) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._state[self._LAST_DECREASE] < cooldown:
+                return False
+            self._state[self._LAST_DECREASE] = now
+            self._refill(now)
+            self._state[self._RATE] = max(min_rate, self._state[self._RATE] * factor)
+            return True
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            paused_until = self._state[self._PAUSED_UNTIL]
+            until = now + seconds
+            if until > paused_until:
+                self._refill(now)
+                self._state[self._PAUSED_SECONDS] += until - max(paused_until, now)
+                self._state[self._PAUSED_UNTIL] = until
+                self._state[self._TOKENS] = 0.0
+
+    async def acquire(self) -> float:
+        """Waits for a token. Returns the number of seconds spent waiting."""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = self._state[self._PAUSED_UNTIL] - now
+                if wait <= 0:
+                    self._refill(now)
+                    if self._state[self._TOKENS] >= 1:
+                        self._state[self._TOKENS] -= 1
+                        return now - started
+                    wait = (1 - self._state[self._TOKENS]) / self._state[self._RATE]
+            await asyncio.sleep(wait)
+
+
+class AdaptiveRateController:
+    """Additive-increase / multiplicative-decrease control of a :class:`TokenBucket` rate.
+
+    Each success adds ``increase / rate``, so the rate grows by about
+    ``increase`` messages/sec for every second of clean sending. A throttle
+    signal multiplies it by ``decrease``; signals arriving within
+    ``cooldown`` seconds of a cut come from requests already in flight at the
+    old rate and do not cut again. Both steps are applied by the bucket, so
+    with a :class:`SharedTokenBucket` the cooldown holds across processes.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        min_rate: float,
+        max_rate: float,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        cooldown: float = 1.0
+    ):
+        self.bucket = bucket
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.decreases = 0
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def on_success(self) -> None:
+        self.bucket.increase_rate(self.increase, self.max_rate)
+
+    def on_throttle(self, retry_after: float = 0.0) -> None:
+        """Cuts the rate after a ``RetryAfter`` (pausing for ``retry_after``) or a timeout."""
+        if retry_after:
+            self.bucket.pause(retry_after)
+        if self.bucket.decrease_rate(self.decrease, self.min_rate, self.cooldown):
+            self.decreases += 1
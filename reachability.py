@@ -0,0 +1,171 @@
+"""
+Registry of users the bot can no longer reach.
+
+Any send site that gets ``Forbidden`` (the user blocked the bot or deleted
+their account) or "chat not found" records the user here, and every send path
+checks the registry first, so no API call is spent on a known-unreachable user.
+Users are cleared again as soon as they write to the bot.
+
+Ids are kept in a sorted ``array('q')`` (8 bytes per user) plus a small set of
+recent changes, and persisted in the same sorted 64-bit format as recipient
+snapshots.
+"""
+import atexit
+import bisect
+import heapq
+import logging
+import os
+import threading
+from array import array
+
+from telegram.error import BadRequest, Forbidden
+
+from recipients import data_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FILENAME = "unreachable.ids"
+MERGE_THRESHOLD = 4096
+
+
+def is_unreachable_error(error):
+    """Returns True if ``error`` means messages to that chat can never be delivered."""
+    if isinstance(error, Forbidden):
+        return True
+    return isinstance(error, BadRequest) and "chat not found" in str(error).lower()
+
+
+class ReachabilityRegistry:
+    """Set of unreachable user ids with atomic persistence to ``filename``."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._ids = array("q")
+        self._added = set()
+        self._dirty = False
+
+    def load(self):
+        ids = array("q")
+        try:
+            with open(self.filename, "rb") as f:
+                ids.frombytes(f.read())
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Could not load unreachable users from {self.filename}: {e}")
+        with self._lock:
+            self._ids = ids
+            self._added.clear()
+            self._dirty = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._ids) + len(self._added)
+
+    def _find(self, user_id):
+        position = bisect.bisect_left(self._ids, user_id)
+        return position if position < len(self._ids) and self._ids[position] == user_id else None
+
+    def __contains__(self, user_id):
+        user_id = int(user_id)
+        with self._lock:
+            return user_id in self._added or self._find(user_id) is not None
+
+    def add(self, user_id):
+        user_id = int(user_id)
+        with self._lock:
+            if user_id in self._added or self._find(user_id) is not None:
+                return
+            self._added.add(user_id)
+            self._dirty = True
+            if len(self._added) >= MERGE_THRESHOLD:
+                self._merge()
+
+    def discard(self, user_id):
+        user_id = int(user_id)
+        with self._lock:
+            if user_id in self._added:
+                self._added.remove(user_id)
+                self._dirty = True
+                return
+            position = self._find(user_id)
+            if position is not None:
+                del self._ids[position]
+                self._dirty = True
+
+    def _merge(self):
+        if self._added:
+            self._ids = array("q", heapq.merge(self._ids, sorted(self._added)))
+            self._added.clear()
+
+    def flush(self):
+        """Writes the registry to disk if it changed. Returns True if a write happened."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._merge()
+            payload = self._ids.tobytes()
+            self._dirty = False
+        try:
+            tmp_filename = f"{self.filename}.tmp"
+            with open(tmp_filename, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_filename, self.filename)
+        except OSError as e:
+            logger.exception(f"Error saving unreachable users: {e}")
+            self._dirty = True
+            return False
+        return True
+
+
+_registry = ReachabilityRegistry(data_path(DEFAULT_FILENAME))
+_registry.load()
+atexit.register(_registry.flush)
+
+
+def is_unreachable(user_id):
+    """Returns True if sending to ``user_id`` is known to fail."""
+    return user_id in _registry
+
+
+def mark_unreachable(user_id):
+    _registry.add(user_id)
+
+
+def mark_reachable(user_id):
+    """Clears ``user_id`` after they contacted the bot again."""
+    _registry.discard(user_id)
+
+
+def record_error(user_id, error):
+    """Marks ``user_id`` unreachable if ``error`` says so. Returns True if it did."""
+    if not is_unreachable_error(error):
+        return False
+    mark_unreachable(user_id)
+    logger.info(f"User {user_id} is unreachable: {error}")
+    return True
+
+
+def get_unreachable_count():
+    return len(_registry)
+
+
+def flush():
+    return _registry.flush()
+
+
+def get_registry_path():
+    return _registry.filename
+
+
+def open_read_only(filename):
+    """Replaces the registry with a copy of ``filename`` that is never written back.
+
+    Broadcast worker processes use this: they report the users they find
+    unreachable, and the parent process records them.
+    """
+    global _registry
+    atexit.unregister(_registry.flush)
+    _registry = ReachabilityRegistry(filename)
+    _registry.load()
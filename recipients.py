@@ -0,0 +1,162 @@
+"""
+Frozen recipient lists for broadcasts.
+
+When a broadcast starts, the ids of its audience are written once into a compact
+binary file: a sorted array of 64-bit integers, 8 bytes per recipient. The
+broadcast then reads recipients through ``mmap``, so it works on a consistent
+set of users while ``/start`` keeps registering people, holds no per-user
+Python objects, and can address any recipient by offset (for resuming or
+splitting a broadcast).
+"""
+import asyncio
+import heapq
+import logging
+import mmap
+import os
+from array import array
+
+import user_referral_system as urs
+from segments import Segment
+
+logger = logging.getLogger(__name__)
+
+ITEM_SIZE = 8
+SORT_RUN_SIZE = 1 << 20
+
+
+def data_path(filename):
+    """Returns the path of ``filename`` in the directory of the user data file."""
+    return os.path.join(os.path.dirname(os.path.abspath(urs.DEFAULT_FILENAME)), filename)
+
+
+def snapshot_path(name="broadcast"):
+    """Returns the path of a recipient snapshot stored next to the user data file."""
+    return data_path(f"{name}.recipients")
+
+
+class SortedRuns:
+    """Sorted runs of ids spilled to ``path`` as they are built.
+
+    Only the run being filled is held in memory; :meth:`merge` reads the
+    spilled runs back through ``mmap``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "wb")
+        # (start, end) item offsets of every run in the file
+        self._bounds = []
+        self._count = 0
+
+    def add(self, run):
+        run = array("q", sorted(run))
+        run.tofile(self._file)
+        self._bounds.append((self._count, self._count + len(run)))
+        self._count += len(run)
+
+    def merge(self):
+        """Yields the ids of all runs in ascending order (duplicates included)."""
+        self._file.close()
+        if not self._count:
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ids = memoryview(data).cast("q")
+            runs = [ids[start:end] for start, end in self._bounds]
+            merged = heapq.merge(*runs)
+            try:
+                yield from merged
+            finally:
+                # Views must be released before the mmap can close.
+                merged.close()
+                for run in runs:
+                    run.release()
+                ids.release()
+
+    def remove(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def write_snapshot(path, ids):
+    """Writes ascending ``ids`` to ``path``, dropping duplicates. Returns the number of ids written."""
+    count = 0
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        buffer = array("q")
+        previous = None
+        for user_id in ids:
+            if user_id == previous:
+                continue
+            previous = user_id
+            buffer.append(user_id)
+            if len(buffer) >= SORT_RUN_SIZE:
+                buffer.tofile(f)
+                count += len(buffer)
+                buffer = array("q")
+        buffer.tofile(f)
+        count += len(buffer)
+    os.replace(tmp_path, path)
+    return count
+
+
+class RecipientSnapshot:
+    """Read-only, memory-mapped view of a recipient snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._ids = memoryview(self._mmap).cast("q") if self._mmap else memoryview(b"").cast("q")
+
+    @classmethod
+    async def create(cls, path, segment=None, chunk_size=1000):
+        """Streams the user ids of ``segment`` (all users by default) into a new snapshot at ``path`` and opens it."""
+        runs = SortedRuns(f"{path}.runs")
+        try:
+            run = array("q")
+            async for user_id in urs.iter_segment_async(segment or Segment(), chunk_size):
+                run.append(user_id)
+                if len(run) >= SORT_RUN_SIZE:
+                    runs.add(run)
+                    run = array("q")
+            runs.add(run)
+            count = await asyncio.get_running_loop().run_in_executor(None, write_snapshot, path, runs.merge())
+        finally:
+            runs.remove()
+        logger.info(f"Wrote {count} recipients to {path}")
+        return cls(path)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, offset):
+        return self._ids[offset]
+
+    def iter_from(self, offset=0):
+        """Yields ``(offset, user_id)`` pairs starting at ``offset``."""
+        for position in range(offset, len(self._ids)):
+            yield position, self._ids[position]
+
+    def close(self):
+        self._ids.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def remove(self):
+        """Closes the snapshot and deletes its file."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
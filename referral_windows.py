@@ -0,0 +1,126 @@
+"""
+Time-windowed referral counters for campaign leaderboards.
+
+Each window (last day, week, month) is a fixed-size ring of time buckets; every
+bucket counts referrals per referrer for one slice of time. Recording an event
+touches one bucket per window, stale buckets are reused as the ring wraps, and
+answering "top referrers this week" only sums the live buckets, so memory and
+query cost depend on the number of active referrers, not on history.
+"""
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# window name -> (bucket length in seconds, number of buckets)
+WINDOWS = {
+    "day": (3600, 24),
+    "week": (86400, 7),
+    "month": (86400, 30),
+}
+
+
+class WindowedCounter:
+    """Per-referrer counts over a sliding window made of ``bucket_count`` buckets."""
+
+    def __init__(self, bucket_seconds, bucket_count):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self._epochs = [None] * bucket_count
+        self._buckets = [Counter() for _ in range(bucket_count)]
+
+    def record(self, referrer_id, timestamp):
+        epoch = int(timestamp // self.bucket_seconds)
+        slot = epoch % self.bucket_count
+        if self._epochs[slot] != epoch:
+            if self._epochs[slot] is not None and self._epochs[slot] > epoch:
+                return  # older than the window
+            self._epochs[slot] = epoch
+            self._buckets[slot].clear()
+        self._buckets[slot][referrer_id] += 1
+
+    def totals(self, now):
+        """Returns a Counter of referrals per referrer inside the window ending at ``now``."""
+        current = int(now // self.bucket_seconds)
+        totals = Counter()
+        for epoch, bucket in zip(self._epochs, self._buckets):
+            if epoch is not None and current - self.bucket_count < epoch <= current:
+                totals.update(bucket)
+        return totals
+
+    def to_dict(self):
+        return {
+            "epochs": self._epochs,
+            "buckets": [{str(k): v for k, v in bucket.items()} for bucket in self._buckets],
+        }
+
+    def load_dict(self, data):
+        if len(data.get("epochs", ())) != self.bucket_count:
+            return
+        self._epochs = list(data["epochs"])
+        self._buckets = [Counter({int(k): v for k, v in bucket.items()}) for bucket in data["buckets"]]
+
+
+class ReferralWindows:
+    """Daily, weekly and monthly referral counters with JSON persistence."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._counters = {
+            name: WindowedCounter(bucket_seconds, bucket_count)
+            for name, (bucket_seconds, bucket_count) in WINDOWS.items()
+        }
+
+    def load(self):
+        try:
+            with open(self.filename, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Could not load referral windows from {self.filename}: {e}")
+            return
+        with self._lock:
+            for name, counter in self._counters.items():
+                if name in data:
+                    counter.load_dict(data[name])
+
+    def record(self, referrer_id, timestamp=None):
+        """Counts one referral for ``referrer_id`` in every window."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for counter in self._counters.values():
+                counter.record(int(referrer_id), timestamp)
+            self._dirty = True
+
+    def top(self, window, n=10, now=None):
+        """Returns up to ``n`` ``(referrer_id, count)`` pairs for ``window``, highest first."""
+        now = time.time() if now is None else now
+        with self._lock:
+            totals = self._counters[window].totals(now)
+        return heapq.nlargest(n, totals.items(), key=lambda item: item[1])
+
+    def flush(self):
+        """Writes the counters to disk if they changed. Returns True if a write happened."""
+        with self._lock:
+            if not self._dirty:
+                return False
+            data = {name: counter.to_dict() for name, counter in self._counters.items()}
+            self._dirty = False
+        try:
+            tmp_filename = f"{self.filename}.tmp"
+            with open(tmp_filename, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_filename, self.filename)
+        except OSError as e:
+            logger.exception(f"Error saving referral windows: {e}")
+            self._dirty = True
+            return False
+        return True
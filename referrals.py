@@ -0,0 +1,47 @@
+"""
+This module contains the implementation of the /referrals command, which lists the users referred by a given user.
+"""
+import html
+from telegram import Update
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+import user_referral_system as urs
+from config import get_admin_user_id
+
+ADMIN_USER_ID = get_admin_user_id()  # Use the admin user ID from config
+PAGE_SIZE = 20
+
+async def referrals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles the /referrals <user_id> [after_id] command to list who a user referred."""
+    user_id = update.effective_user.id
+    if user_id != ADMIN_USER_ID:
+        await update.message.reply_text("🚫 You are not authorized to use this command.")
+        return
+
+    args = context.args or []
+    try:
+        referrer_id = int(args[0])
+        after = int(args[1]) if len(args) > 1 else None
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /referrals <user_id> [after_user_id]")
+        return
+
+    # One extra row tells whether there is a next page.
+    total, referred = await urs.get_referrals_async(referrer_id, after=after, limit=PAGE_SIZE + 1)
+    if not total:
+        await update.message.reply_text(f"📊 User {referrer_id} has not referred anyone yet.")
+        return
+    if not referred:
+        await update.message.reply_text(f"❌ User {referrer_id} has not referred anyone after {after}.")
+        return
+
+    has_more = len(referred) > PAGE_SIZE
+    referred = referred[:PAGE_SIZE]
+    message = f"👥 <b>Users referred by {referrer_id}</b> ({total} total)\n\n"
+    for referred_id, username in referred:
+        message += f"• {html.escape(username or 'Unknown User')} (<code>{referred_id}</code>)\n"
+
+    if has_more:
+        message += f"\nNext page: /referrals {referrer_id} {referred[-1][0]}"
+
+    await update.message.reply_text(message, parse_mode=ParseMode.HTML)
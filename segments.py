@@ -0,0 +1,90 @@
+"""
+Broadcast audience segments.
+
+A segment selects recipients by one stored attribute: referral count,
+referrer or registration date. The stores answer every kind from an index
+where one exists (the leaderboard and referral indexes of the user table, the
+registration-time column, or the matching SQLite index), so the preview can
+show the audience size and the snapshot can stream its ids without loading
+the users outside the segment.
+"""
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+KINDS = ("all", "min_referrals", "below_referrals", "referred_by", "registered")
+DATE_FORMAT = "%Y-%m-%d"
+
+USAGE = (
+    "Audience options for /broadcast:\n"
+    "/broadcast - all users\n"
+    "/broadcast min_referrals N - users with at least N referrals\n"
+    "/broadcast below_referrals N - users with fewer than N referrals\n"
+    "/broadcast referred_by USER_ID - users referred by USER_ID\n"
+    "/broadcast registered YYYY-MM-DD [YYYY-MM-DD] - users registered between the dates (inclusive)"
+)
+
+
+def _parse_positive(text, name):
+    try:
+        value = int(text)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number") from None
+    if value < 1:
+        raise ValueError(f"{name} must be at least 1")
+    return value
+
+
+def _parse_date(text):
+    try:
+        return datetime.strptime(text, DATE_FORMAT)
+    except ValueError:
+        raise ValueError(f"Dates must look like {datetime.now().strftime(DATE_FORMAT)}") from None
+
+
+@dataclass(frozen=True)
+class Segment:
+    """Recipient selection. ``value`` is the threshold, the referrer id or the range start."""
+    kind: str = "all"
+    value: Optional[int] = None
+    # Exclusive end of the registration time range
+    end: Optional[int] = None
+
+    @classmethod
+    def parse(cls, args):
+        """Builds a segment from command arguments. Raises ValueError with a user-facing message."""
+        if not args:
+            return cls()
+        kind, rest = args[0].lower(), args[1:]
+        if kind == "all" and not rest:
+            return cls()
+        if kind in ("min_referrals", "below_referrals", "referred_by") and len(rest) == 1:
+            name = "USER_ID" if kind == "referred_by" else "N"
+            return cls(kind, _parse_positive(rest[0], name))
+        if kind == "registered" and 1 <= len(rest) <= 2:
+            start = _parse_date(rest[0])
+            last = _parse_date(rest[1]) if len(rest) == 2 else start
+            if last < start:
+                raise ValueError("The end date is before the start date")
+            return cls(kind, int(start.timestamp()), int((last + timedelta(days=1)).timestamp()))
+        raise ValueError(USAGE)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data) if data else cls()
+
+    def to_dict(self):
+        return asdict(self)
+
+    def describe(self):
+        if self.kind == "min_referrals":
+            return f"users with at least {self.value} referrals"
+        if self.kind == "below_referrals":
+            return f"users with fewer than {self.value} referrals"
+        if self.kind == "referred_by":
+            return f"users referred by {self.value}"
+        if self.kind == "registered":
+            start = datetime.fromtimestamp(self.value).strftime(DATE_FORMAT)
+            last = datetime.fromtimestamp(self.end - 1).strftime(DATE_FORMAT)
+            return f"users registered {start}" if start == last else f"users registered {start} to {last}"
+        return "all users"
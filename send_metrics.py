@@ -0,0 +1,184 @@
+"""
+Per-request instrumentation for broadcasts.
+
+:class:`SendMetrics` records the latency of every ``copyMessage`` request, the
+``TelegramError`` classes returned, how long workers waited on the rate
+limiter, how long sending was paused by ``RetryAfter``, the ``RETRY_DELAY``
+backoff slept, and how many attempts each recipient needed. It is stored in
+the broadcast checkpoint so a resumed broadcast reports on the whole run, and
+written as a JSON report when the broadcast ends.
+
+Latencies go into a log-bucketed histogram (buckets 5% apart), so memory stays
+constant however many messages are sent and percentiles are within 5%.
+"""
+import json
+import math
+import os
+from collections import Counter
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """Histogram of durations with geometrically growing millisecond buckets."""
+
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, seconds):
+        milliseconds = seconds * 1000
+        return 0 if milliseconds <= 1 else math.ceil(math.log(milliseconds, self.GROWTH))
+
+    def record(self, seconds):
+        self.buckets[self._bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Returns the upper bound, in seconds, of the bucket holding the ``percent``-th percentile."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.GROWTH ** bucket / 1000, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+            "buckets": {str(bucket): count for bucket, count in sorted(self.buckets.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.count = data.get("count", 0)
+        histogram.total = data.get("total", 0.0)
+        histogram.max = data.get("max", 0.0)
+        histogram.buckets = Counter({int(bucket): count for bucket, count in data.get("buckets", {}).items()})
+        return histogram
+
+
+class SendMetrics:
+    """Counters and latency histogram for the requests of one broadcast."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        # TelegramError class name -> number of requests that failed with it
+        self.errors = Counter()
+        # Number of attempts a recipient needed -> number of recipients
+        self.attempts = Counter()
+        self.retry_after_count = 0
+        self.retry_after_requested = 0.0
+        self.throttle_pause_seconds = 0.0
+        self.pacing_wait_seconds = 0.0
+        self.retry_delay_seconds = 0.0
+        self._seen_pause = 0.0
+
+    def record_request(self, seconds, error=None):
+        self.latency.record(seconds)
+        if error is not None:
+            self.errors[type(error).__name__] += 1
+
+    def record_retry_after(self, seconds):
+        self.retry_after_count += 1
+        self.retry_after_requested += seconds
+
+    def record_outcome(self, attempts):
+        self.attempts[attempts] += 1
+
+    def track_pauses(self, bucket):
+        """Adds the time ``bucket`` spent paused by ``RetryAfter`` since the last call."""
+        self.throttle_pause_seconds += bucket.paused_seconds - self._seen_pause
+        self._seen_pause = bucket.paused_seconds
+
+    def merge(self, other):
+        """Adds the requests recorded by ``other``, e.g. by a broadcast worker process."""
+        self.latency.merge(other.latency)
+        self.errors.update(other.errors)
+        self.attempts.update(other.attempts)
+        self.retry_after_count += other.retry_after_count
+        self.retry_after_requested += other.retry_after_requested
+        self.throttle_pause_seconds += other.throttle_pause_seconds
+        self.pacing_wait_seconds += other.pacing_wait_seconds
+        self.retry_delay_seconds += other.retry_delay_seconds
+
+    @property
+    def retries(self):
+        return sum((attempts - 1) * recipients for attempts, recipients in self.attempts.items())
+
+    def to_dict(self):
+        data = {
+            "requests": self.latency.count,
+            "latency": self.latency.to_dict(),
+            "errors": dict(self.errors),
+            "attempts": {str(attempts): count for attempts, count in sorted(self.attempts.items())},
+            "retries": self.retries,
+            "retry_after_count": self.retry_after_count,
+            "retry_after_requested": self.retry_after_requested,
+            "throttle_pause_seconds": self.throttle_pause_seconds,
+            "pacing_wait_seconds": self.pacing_wait_seconds,
+            "retry_delay_seconds": self.retry_delay_seconds,
+        }
+        for percent in PERCENTILES:
+            data["latency"][f"p{percent}"] = self.latency.percentile(percent)
+        data["latency"]["mean"] = self.latency.mean
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        metrics = cls()
+        if not data:
+            return metrics
+        metrics.latency = LatencyHistogram.from_dict(data.get("latency", {}))
+        metrics.errors = Counter(data.get("errors", {}))
+        metrics.attempts = Counter({int(attempts): count for attempts, count in data.get("attempts", {}).items()})
+        metrics.retry_after_count = data.get("retry_after_count", 0)
+        metrics.retry_after_requested = data.get("retry_after_requested", 0.0)
+        metrics.throttle_pause_seconds = data.get("throttle_pause_seconds", 0.0)
+        metrics.pacing_wait_seconds = data.get("pacing_wait_seconds", 0.0)
+        metrics.retry_delay_seconds = data.get("retry_delay_seconds", 0.0)
+        return metrics
+
+    def format_summary(self):
+        """Returns the human-readable lines for the admin summary."""
+        percentiles = " / ".join(f"{self.latency.percentile(percent) * 1000:.0f}" for percent in PERCENTILES)
+        errors = ", ".join(f"{name} {count}" for name, count in self.errors.most_common()) or "none"
+        attempts = ", ".join(f"{attempts}: {count}" for attempts, count in sorted(self.attempts.items())) or "none"
+        pacing = self.pacing_wait_seconds / self.latency.count * 1000 if self.latency.count else 0
+        return (
+            f"⏱ Requests: {self.latency.count}, latency p50/p95/p99: {percentiles} ms (max {self.latency.max * 1000:.0f} ms)\n"
+            f"⚠️ Errors: {errors}\n"
+            f"🔁 Attempts per recipient: {attempts} ({self.retries} retries, {self.retry_delay_seconds:.1f}s backoff)\n"
+            f"🐢 RetryAfter: {self.retry_after_count} times, sending paused {self.throttle_pause_seconds:.1f}s\n"
+            f"🚦 Rate limiter wait: {pacing:.0f} ms per request ({self.pacing_wait_seconds:.1f}s across workers)"
+        )
+
+
+def write_report(path, report):
+    """Atomically writes a broadcast report dict as JSON."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,336 @@
+"""
+Multi-process broadcasting.
+
+A single event loop spends its CPU on building, encoding and parsing requests
+and tops out long before a large audience is done. With
+``BroadcastConfig.PROCESS_COUNT`` above 1 the recipient snapshot is split
+into contiguous offset ranges (shards), and each shard is sent by its own
+worker process with its own ``Bot`` and ``WORKER_COUNT`` send tasks.
+
+Every process draws from one :class:`rate_limiter.SharedTokenBucket`, so the
+total rate, ``RetryAfter`` pauses and AIMD cuts stay global. Workers report
+finished and failed offsets, counters and the users to remove to the parent every
+``REPORT_INTERVAL`` seconds, and their request metrics when they finish; the
+parent merges them into the broadcast checkpoint, progress message and
+summary, and remains the only process writing files.
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import signal
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Set
+
+logger = logging.getLogger(__name__)
+
+REPORT_INTERVAL = 0.5
+POLL_INTERVAL = 0.05
+
+
+@dataclass
+class ShardCheckpoint:
+    """Progress through the offsets ``start`` to ``end`` of the snapshot, tracked like the broadcast checkpoint.
+
+    ``failed`` may also hold offsets outside the range, handed over from the
+    broadcast checkpoint when a broadcast is first split into shards.
+    """
+    start: int
+    end: int
+    cursor: int
+    done_after: Set[int] = field(default_factory=set)
+    failed: Set[int] = field(default_factory=set)
+
+    @property
+    def completed(self) -> int:
+        return self.cursor - self.start + len(self.done_after) - len(self.failed)
+
+    @property
+    def is_done(self) -> bool:
+        return self.cursor >= self.end and not self.failed
+
+    def mark_done(self, offset: int) -> None:
+        if offset in self.failed:
+            self.failed.remove(offset)
+            return
+        self._advance(offset)
+
+    def mark_failed(self, offset: int) -> None:
+        if offset not in self.failed:
+            self.failed.add(offset)
+            self._advance(offset)
+
+    def _advance(self, offset: int) -> None:
+        if offset < self.cursor:
+            return
+        self.done_after.add(offset)
+        while self.cursor in self.done_after:
+            self.done_after.remove(self.cursor)
+            self.cursor += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "start": self.start,
+            "end": self.end,
+            "cursor": self.cursor,
+            "done_after": sorted(self.done_after),
+            "failed": sorted(self.failed),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ShardCheckpoint":
+        return cls(
+            data["start"], data["end"], data["cursor"],
+            set(data.get("done_after", ())), set(data.get("failed", ()))
+        )
+
+
+def plan_shards(cursor: int, total: int, done_after: Set[int], count: int, failed: Set[int] = frozenset()) -> List[ShardCheckpoint]:
+    """Splits the offsets from ``cursor`` to ``total`` into up to ``count`` equal shards.
+
+    The ``failed`` offsets are retried by the first shard.
+    """
+    remaining = total - cursor
+    count = max(1, min(count, remaining))
+    shards = []
+    for index in range(count):
+        start = cursor + remaining * index // count
+        end = cursor + remaining * (index + 1) // count
+        shard = ShardCheckpoint(start, end, start)
+        for offset in sorted(offset for offset in done_after if start <= offset < end):
+            shard.mark_done(offset)
+        shards.append(shard)
+    shards[0].failed.update(failed)
+    return shards
+
+
+@dataclass
+class ShardTask:
+    """Everything a worker process needs to send one shard."""
+    index: int
+    shard: ShardCheckpoint
+    snapshot_path: str
+    registry_path: str
+    payload: Any
+    config: Any
+    bot_factory: Callable[[], Any]
+
+
+class _ShardReport:
+    """What a worker has done since its last report."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.clear()
+
+    def clear(self) -> None:
+        self.done: List[int] = []
+        self.failed: List[int] = []
+        self.sent = 0
+        self.blocked = 0
+        self.remove: List[int] = []
+        self.unreachable: List[int] = []
+
+    def take(self) -> Dict:
+        report = {
+            "shard": self.index,
+            "done": self.done,
+            "failed": self.failed,
+            "sent": self.sent,
+            "blocked": self.blocked,
+            "remove": self.remove,
+            "unreachable": self.unreachable,
+        }
+        self.clear()
+        return report
+
+
+def run_shard(task: ShardTask, bucket, reports, unpaused, stop) -> None:
+    """Entry point of a worker process."""
+    # The parent decides when to stop; Ctrl+C reaches the whole process group.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import reachability
+    reachability.open_read_only(task.registry_path)
+
+    report = _ShardReport(task.index)
+    final = {"finished": True}
+    try:
+        final.update(asyncio.run(_send_shard(task, bucket, reports, report, unpaused, stop)))
+    except Exception as e:
+        logger.exception(f"Broadcast shard {task.index} failed: {e}")
+        final["error"] = str(e)
+    final.update(report.take())
+    reports.put(final)
+
+
+async def _send_shard(task: ShardTask, bucket, reports, report: _ShardReport, unpaused, stop) -> Dict:
+    import reachability
+    from broadcast import BroadcastManager
+    from rate_limiter import AdaptiveRateController
+    from recipients import RecipientSnapshot
+
+    config = task.config
+    manager = BroadcastManager(config)
+    manager.rate_controller = AdaptiveRateController(
+        bucket,
+        min_rate=config.MIN_MESSAGES_PER_SECOND,
+        max_rate=config.MAX_MESSAGES_PER_SECOND,
+        increase=config.RATE_INCREASE,
+        decrease=config.RATE_DECREASE_FACTOR
+    )
+    bot = task.bot_factory()
+    context = SimpleNamespace(bot=bot)
+    if hasattr(bot, "initialize"):
+        await bot.initialize()
+
+    def recipients_to_send():
+        shard = task.shard
+        # Recipients whose sends failed in an earlier run go first.
+        for offset in sorted(shard.failed):
+            yield offset, snapshot[offset]
+        for offset, user_id in snapshot.iter_from(shard.cursor):
+            if offset >= shard.end:
+                break
+            if offset not in shard.done_after:
+                yield offset, user_id
+
+    async def produce(recipients: asyncio.Queue) -> None:
+        for offset, user_id in recipients_to_send():
+            if stop.is_set():
+                break
+            user_id = int(user_id)
+            if reachability.is_unreachable(user_id):
+                report.blocked += 1
+                report.remove.append(user_id)
+                report.done.append(offset)
+                continue
+            await recipients.put((offset, user_id))
+        for _ in range(config.WORKER_COUNT):
+            await recipients.put(None)
+
+    async def send(recipients: asyncio.Queue) -> None:
+        while True:
+            item = await recipients.get()
+            if item is None:
+                return
+            while not unpaused.is_set() and not stop.is_set():
+                await asyncio.sleep(POLL_INTERVAL)
+            if stop.is_set():
+                # Leave the rest of the queue for the resumed broadcast.
+                continue
+            offset, user_id = item
+            if await manager.send_with_retry(context, user_id, task.payload):
+                report.sent += 1
+            elif reachability.is_unreachable(user_id):
+                report.blocked += 1
+                report.remove.append(user_id)
+                report.unreachable.append(user_id)
+            else:
+                # Left for the resumed broadcast to retry.
+                report.failed.append(offset)
+                continue
+            report.done.append(offset)
+
+    async def report_progress() -> None:
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            reports.put(report.take())
+
+    snapshot = RecipientSnapshot(task.snapshot_path)
+    reporter = asyncio.create_task(report_progress())
+    try:
+        recipients: asyncio.Queue = asyncio.Queue(maxsize=config.WORKER_COUNT * 2)
+        await asyncio.gather(
+            produce(recipients),
+            *(send(recipients) for _ in range(config.WORKER_COUNT))
+        )
+    finally:
+        reporter.cancel()
+        snapshot.close()
+        if hasattr(bot, "shutdown"):
+            await bot.shutdown()
+    return {"metrics": manager.metrics.to_dict(), "decreases": manager.rate_controller.decreases}
+
+
+class ShardedRun:
+    """Runs one worker process per :class:`ShardTask` and hands their reports to ``on_report``.
+
+    The workers are spawned rather than forked: the parent runs an event
+    loop and storage threads whose state must not be copied mid-flight.
+    """
+
+    def __init__(self, tasks: List[ShardTask], bucket, context=None):
+        self.tasks = tasks
+        self.bucket = bucket
+        self._context = context or multiprocessing.get_context("spawn")
+        self.reports = self._context.Queue()
+        self.unpaused = self._context.Event()
+        self.unpaused.set()
+        self.stop = self._context.Event()
+
+    def pause(self) -> None:
+        self.unpaused.clear()
+
+    def unpause(self) -> None:
+        self.unpaused.set()
+
+    async def run(self, on_report: Callable[[Dict], None]) -> None:
+        """Sends every shard. Raises RuntimeError if a worker failed.
+
+        When cancelled, the workers stop taking recipients and their last
+        reports are still delivered before the cancellation propagates.
+        """
+        processes = {
+            task.index: self._context.Process(
+                target=run_shard,
+                args=(task, self.bucket, self.reports, self.unpaused, self.stop),
+                name=f"broadcast-shard-{task.index}",
+                daemon=True
+            )
+            for task in self.tasks
+        }
+        for process in processes.values():
+            process.start()
+        try:
+            try:
+                errors = await self._collect(processes, on_report)
+            except asyncio.CancelledError:
+                self.stop.set()
+                await self._collect(processes, on_report)
+                raise
+        finally:
+            self.stop.set()
+            loop = asyncio.get_running_loop()
+            for process in processes.values():
+                await loop.run_in_executor(None, process.join, 5)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        if errors:
+            raise RuntimeError("; ".join(errors))
+
+    async def _collect(self, processes: Dict[int, multiprocessing.Process], on_report: Callable[[Dict], None]) -> List[str]:
+        running = set(processes)
+        errors = []
+        while running:
+            try:
+                report = self.reports.get_nowait()
+            except queue.Empty:
+                exited = [index for index in running if not processes[index].is_alive()]
+                if exited:
+                    # Reports are flushed before a worker exits; one may still be in the pipe.
+                    await asyncio.sleep(POLL_INTERVAL)
+                    if self.reports.empty():
+                        for index in exited:
+                            errors.append(f"shard {index} exited with code {processes[index].exitcode}")
+                            running.discard(index)
+                    continue
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            on_report(report)
+            if report.get("finished"):
+                running.discard(report["shard"])
+                if report.get("error"):
+                    errors.append(f"shard {report['shard']}: {report['error']}")
+        return errors
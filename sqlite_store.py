@@ -0,0 +1,375 @@
+"""
+SQLite storage backend for the user referral system.
+
+Users are stored one row per user, so registering a user is a single UPSERT
+plus an atomic counter increment on the referrer instead of a rewrite of the
+whole JSON document.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from user_table import UserRecord, UserTable
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    username TEXT,
+    referral_count INTEGER NOT NULL DEFAULT 0,
+    referred_by INTEGER,
+    registered_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_users_referral_count ON users (referral_count);
+CREATE INDEX IF NOT EXISTS idx_users_referrals ON users (referred_by, user_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('total_users', 0);
+"""
+
+# Created after the column exists, so databases from before registration
+# times are upgraded first.
+REGISTERED_AT_INDEX = "CREATE INDEX IF NOT EXISTS idx_users_registered_at ON users (registered_at)"
+
+
+def _segment_filter(segment):
+    """Returns the ``WHERE`` clause and parameters selecting a :class:`segments.Segment`."""
+    if segment.kind == "min_referrals":
+        return "referral_count >= ?", (segment.value,)
+    if segment.kind == "below_referrals":
+        return "referral_count < ?", (segment.value,)
+    if segment.kind == "referred_by":
+        return "referred_by = ?", (segment.value,)
+    if segment.kind == "registered":
+        return "registered_at >= ? AND registered_at < ?", (segment.value, segment.end)
+    return "1", ()
+
+
+def _to_user_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class SqliteUserStore:
+    """User store backed by a local SQLite database.
+
+    Exposes the same methods as :class:`user_referral_system.UserStore`. Every
+    write is committed immediately, so :meth:`flush` has nothing to do.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        # Called with the referrer id whenever a referral is credited
+        self.on_referral = None
+        self._conn = None
+
+    def load(self):
+        """Opens the database and creates the schema if needed."""
+        with self._lock:
+            if self._conn is None:
+                try:
+                    conn = sqlite3.connect(self.path, check_same_thread=False)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.executescript(SCHEMA)
+                    columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+                    if "registered_at" not in columns:
+                        conn.execute("ALTER TABLE users ADD COLUMN registered_at INTEGER")
+                    conn.execute(REGISTERED_AT_INDEX)
+                    # Superseded by idx_users_referrals, whose prefix serves the same lookups
+                    conn.execute("DROP INDEX IF EXISTS idx_users_referred_by")
+                    conn.commit()
+                except sqlite3.Error as e:
+                    logger.exception(f"Error opening database {self.path}: {e}")
+                    return None
+                self._conn = conn
+            return self._conn
+
+    @property
+    def dirty(self):
+        return False
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _get_total(self, conn):
+        return conn.execute("SELECT value FROM meta WHERE key = 'total_users'").fetchone()[0]
+
+    def load_data(self):
+        """Returns all users in the ``{"users": ..., "total_users": ...}`` layout."""
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return None
+            users = UserTable()
+            for user_id, username, referral_count, referred_by, registered_at in conn.execute(
+                "SELECT user_id, username, referral_count, referred_by, registered_at FROM users "
+                "ORDER BY registered_at, rowid"
+            ):
+                users.add(user_id, username, referral_count, referred_by, registered_at)
+            return {"users": users, "total_users": self._get_total(conn)}
+
+    def save_data(self, data):
+        """Replaces the whole user table with ``data``."""
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.execute("DELETE FROM users")
+                    conn.executemany(
+                        "INSERT INTO users (user_id, username, referral_count, referred_by, registered_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (
+                            (
+                                int(user_id),
+                                user.get("username"),
+                                user.get("referral_count", 0),
+                                user.get("referred_by"),
+                                user.get("registered_at")
+                            )
+                            for user_id, user in data.get("users", {}).items()
+                        )
+                    )
+                    conn.execute(
+                        "UPDATE meta SET value = ? WHERE key = 'total_users'",
+                        (data.get("total_users", 0),)
+                    )
+            except sqlite3.Error as e:
+                logger.exception(f"Error saving data: {e}")
+
+    def import_json(self, filename):
+        """Imports an existing JSON user data file into an empty database."""
+        try:
+            with open(filename, "r") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Could not import {filename}: {e}")
+            return
+        if data.get("users"):
+            self.save_data(data)
+            logger.info(f"Imported {len(data['users'])} users from {filename} into {self.path}")
+
+    def _insert_user(self, conn, user_id, username, referred_by, credited, registered_at):
+        cursor = conn.execute(
+            "INSERT INTO users (user_id, username, referral_count, referred_by, registered_at) "
+            "VALUES (?, ?, 0, NULL, ?) ON CONFLICT (user_id) DO NOTHING",
+            (int(user_id), username, registered_at)
+        )
+        if cursor.rowcount == 0:
+            return False
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'total_users'")
+
+        if referred_by:
+            referrer_id = _to_user_id(referred_by)
+            cursor = conn.execute(
+                "UPDATE users SET referral_count = referral_count + 1 WHERE user_id = ?",
+                (referrer_id,)
+            )
+            if cursor.rowcount:
+                conn.execute(
+                    "UPDATE users SET referred_by = ? WHERE user_id = ?",
+                    (referrer_id, int(user_id))
+                )
+                credited.append(referrer_id)
+            else:
+                logger.warning(f"Referrer {referred_by} not found.")
+        return True
+
+    def manage_user(self, user_id, username, referred_by=None):
+        """Manages user data and referral counts. Returns True if this is a new user."""
+        return self.manage_users_batch([(user_id, username, referred_by)])[0]
+
+    def manage_users_batch(self, records):
+        """Applies ``(user_id, username, referred_by)`` records in a single transaction."""
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return [False] * len(records)
+            credited = []
+            registered_at = int(time.time())
+            try:
+                with conn:
+                    results = [
+                        self._insert_user(conn, user_id, username, referred_by, credited, registered_at)
+                        for user_id, username, referred_by in records
+                    ]
+            except sqlite3.Error as e:
+                logger.exception(f"Error managing {len(records)} users: {e}")
+                return [False] * len(records)
+            if self.on_referral:
+                for referrer_id in credited:
+                    self.on_referral(referrer_id)
+            return results
+
+    def remove_users(self, user_ids):
+        """Removes the given users. Returns the number of users actually removed."""
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return 0
+            try:
+                with conn:
+                    cursor = conn.executemany(
+                        "DELETE FROM users WHERE user_id = ?",
+                        ((int(user_id),) for user_id in user_ids)
+                    )
+                    removed = max(cursor.rowcount, 0)
+                    if removed:
+                        conn.execute(
+                            "UPDATE meta SET value = MAX(value - ?, 0) WHERE key = 'total_users'",
+                            (removed,)
+                        )
+                    return removed
+            except sqlite3.Error as e:
+                logger.exception(f"Error removing users: {e}")
+                return 0
+
+    def get_referral_count(self, user_id):
+        """Gets the referral count for a user."""
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return 0
+            row = conn.execute(
+                "SELECT referral_count FROM users WHERE user_id = ?",
+                (_to_user_id(user_id),)
+            ).fetchone()
+            return row[0] if row else 0
+
+    def get_user(self, user_id):
+        """Returns the :class:`UserRecord` of a user, or ``None`` if the user is unknown."""
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return None
+            row = conn.execute(
+                "SELECT username, referral_count, referred_by, registered_at FROM users WHERE user_id = ?",
+                (_to_user_id(user_id),)
+            ).fetchone()
+            return UserRecord(*row) if row else None
+
+    def get_referrals(self, user_id, after=None, limit=20):
+        """Returns ``(total, [(user_id, username), ...])`` using the ``(referred_by, user_id)`` index.
+
+        Pages continue after the id ``after`` rather than skipping an offset,
+        so every page is one index seek.
+        """
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return 0, []
+            referrer_id = _to_user_id(user_id)
+            total = conn.execute(
+                "SELECT COUNT(*) FROM users WHERE referred_by = ?",
+                (referrer_id,)
+            ).fetchone()[0]
+            page = conn.execute(
+                "SELECT user_id, username FROM users WHERE referred_by = ? AND user_id > ? "
+                "ORDER BY user_id LIMIT ?",
+                (referrer_id, -(2 ** 63) if after is None else int(after), limit)
+            ).fetchall()
+            return total, page
+
+    def iter_user_chunks(self, chunk_size=1000):
+        """Yields lists of ``(user_id, UserRecord)`` pairs in user id order using keyset pagination."""
+        last_user_id = -(2 ** 63)
+        while True:
+            with self._lock:
+                conn = self.load()
+                if conn is None:
+                    return
+                rows = conn.execute(
+                    "SELECT user_id, username, referral_count, referred_by, registered_at FROM users "
+                    "WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (last_user_id, chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            last_user_id = rows[-1][0]
+            yield [(user_id, UserRecord(*record)) for user_id, *record in rows]
+
+    def count_segment(self, segment):
+        """Returns the number of users in a :class:`segments.Segment` using the matching index."""
+        where, params = _segment_filter(segment)
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return 0
+            return conn.execute(f"SELECT COUNT(*) FROM users WHERE {where}", params).fetchone()[0]
+
+    def iter_segment_chunks(self, segment, chunk_size=1000):
+        """Yields lists of the user ids in ``segment`` in user id order using keyset pagination."""
+        where, params = _segment_filter(segment)
+        last_user_id = -(2 ** 63)
+        while True:
+            with self._lock:
+                conn = self.load()
+                if conn is None:
+                    return
+                ids = [row[0] for row in conn.execute(
+                    f"SELECT user_id FROM users WHERE {where} AND user_id > ? ORDER BY user_id LIMIT ?",
+                    (*params, last_user_id, chunk_size)
+                )]
+            if not ids:
+                return
+            last_user_id = ids[-1]
+            yield ids
+
+    def get_top(self, n=10):
+        """Returns the top ``n`` referrers using the ``referral_count`` index."""
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return []
+            return conn.execute(
+                "SELECT user_id, username, referral_count FROM users WHERE referral_count > 0 "
+                "ORDER BY referral_count DESC LIMIT ?",
+                (n,)
+            ).fetchall()
+
+    def get_rank(self, user_id):
+        """Returns ``(rank, referral_count)`` of a user, or ``None`` if they have no referrals."""
+        count = self.get_referral_count(user_id)
+        if not count:
+            return None
+        with self._lock:
+            ahead = self._conn.execute(
+                "SELECT COUNT(*) FROM users WHERE referral_count > ?",
+                (count,)
+            ).fetchone()[0]
+            return ahead + 1, count
+
+    def get_total_user_count(self):
+        """Gets the total number of registered users."""
+        with self._lock:
+            conn = self.load()
+            if conn is None:
+                return 0
+            return self._get_total(conn)
+
+    def flush(self):
+        """Nothing to do: every write is already committed."""
+        return False
+
+
+def open_store(path, json_filename=None):
+    """Creates a store for ``path``, importing ``json_filename`` if the database is new."""
+    is_new = not os.path.exists(path)
+    store = SqliteUserStore(path)
+    if store.load() is not None and is_new and json_filename and os.path.exists(json_filename):
+        store.import_json(json_filename)
+    return store
@@ -1,65 +1,84 @@
 """
-This module contains the implementation of the /top command, which displays the top 10 users with the most referrals.
+This module contains the implementation of the /top command, which displays the users with the most referrals.
+
+The list comes from the leaderboard index maintained by the user store, so the
+command never scans or sorts the whole user table and never touches the disk.
 """
+import html
 from telegram import Update
+from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
-import json
+import user_referral_system as urs
 from config import get_admin_user_id
+from referral_windows import WINDOWS
 
 ADMIN_USER_ID = get_admin_user_id()  # Use the admin user ID from config
+DEFAULT_TOP_SIZE = 10
+MAX_TOP_SIZE = 100
+WINDOW_TITLES = {"day": "Last 24 Hours", "week": "Last 7 Days", "month": "Last 30 Days"}
+
+def rank_medal(rank: int) -> str:
+    """Returns the emoji shown next to a leaderboard rank."""
+    if rank == 1:
+        return "🥇"
+    elif rank == 2:
+        return "🥈"
+    elif rank == 3:
+        return "🥉"
+    return "🔹"
 
 async def top(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles the /top command to display the top 10 users with the most referrals."""
+    """Handles /top [day|week|month] [N] and /top rank <user_id> to display the users with the most referrals."""
     user_id = update.effective_user.id
     if user_id != ADMIN_USER_ID:
         await update.message.reply_text("🚫 You are not authorized to use this command.")
         return
 
-    # Load data from user_data_converted.json
-    try:
-        with open('users_data_converted.json', 'r') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        await update.message.reply_text("❌ Data file not found. Please check the file path.")
-        return
-    except json.JSONDecodeError:
-        await update.message.reply_text("❌ Invalid data file. Please check the file format.")
+    args = list(context.args or [])
+    if args and args[0].lower() == "rank":
+        await send_rank(update, args[1:])
         return
 
-    users = data.get('users', {})
-
-    # Extract users with referral_count > 0
-    users_with_referrals = [
-        (user_info.get('username', 'Unknown User'), user_info['referral_count'])
-        for user_info in users.values()
-        if 'referral_count' in user_info and user_info['referral_count'] > 0
-    ]
-
-    # Sort users by referral_count in descending order
-    sorted_users = sorted(users_with_referrals, key=lambda x: x[1], reverse=True)
+    window = args.pop(0).lower() if args and args[0].lower() in WINDOWS else None
+    try:
+        size = int(args[0]) if args else DEFAULT_TOP_SIZE
+    except ValueError:
+        await update.message.reply_text("Usage: /top [day|week|month] [N] or /top rank <user_id>")
+        return
+    size = max(1, min(size, MAX_TOP_SIZE))
 
-    # Get top 10 users
-    top_users = sorted_users[:10]
+    if window:
+        top_users = await urs.get_window_top_async(window, size)
+        title = f"Top {size} Referrers — {WINDOW_TITLES[window]}"
+    else:
+        top_users = await urs.get_top_async(size)
+        title = f"Top {size} Users with the Most Referrals"
 
     # Prepare the message with emojis and formatting
     if not top_users:
         message = "📊 No users have made referrals yet."
     else:
-        message = "🏆 *Top 10 Users with the Most Referrals* 🏆\n\n"
-        for rank, (username, count) in enumerate(top_users, start=1):
-            # Add emojis based on rank
-            if rank == 1:
-                medal = "🥇"
-            elif rank == 2:
-                medal = "🥈"
-            elif rank == 3:
-                medal = "🥉"
-            else:
-                medal = "🔹"
-
-            message += f"{medal} *{rank}. {username}* - {count}\n"
+        message = f"🏆 <b>{title}</b> 🏆\n\n"
+        for rank, (_, username, count) in enumerate(top_users, start=1):
+            message += f"{rank_medal(rank)} <b>{rank}. {html.escape(username or 'Unknown User')}</b> - {count}\n"
 
         message += "\n🎉 Keep up the great work! 🎉"
 
     # Send the formatted message
-    await update.message.reply_text(message, parse_mode="Markdown")
\ No newline at end of file
+    await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+
+async def send_rank(update: Update, args):
+    """Replies with the leaderboard rank of a single user."""
+    try:
+        target_id = int(args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("Usage: /top rank <user_id>")
+        return
+
+    rank = await urs.get_rank_async(target_id)
+    if rank is None:
+        await update.message.reply_text(f"📊 User {target_id} has no referrals yet.")
+        return
+
+    position, count = rank
+    await update.message.reply_text(f"{rank_medal(position)} User {target_id} is ranked #{position} with {count} referrals.")
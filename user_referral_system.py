@@ -1,83 +1,724 @@
+import asyncio
+import atexit
+import functools
 import json
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    get_storage_backend,
+    get_sqlite_path,
+    get_journal_compact_bytes,
+    get_storage_max_pending,
+    get_loop_lag_warning,
+)
+from user_table import UserTable, record_object_hook
+from referral_windows import ReferralWindows
 
 logger = logging.getLogger(__name__)
 
-def load_data(filename="users_data_converted.json"):
-    """Loads user data from a JSON file."""
+DEFAULT_FILENAME = "users_data_converted.json"
+WINDOWS_FILENAME = "referral_windows.json"
+
+
+def _empty_data():
+    return {"users": UserTable(), "total_users": 0}
+
+
+def _read_file(filename):
+    """Reads and parses the user data file."""
     try:
         with open(filename, "r") as f:
-            data = json.load(f)
-            return data
+            data = json.load(f, object_hook=record_object_hook)
+        data["users"] = UserTable(data.get("users", {}))
+        return data
     except FileNotFoundError:
         logger.warning(f"File {filename} not found. Creating a new one.")
-        return {"users": {}, "total_users": 0}
+        return _empty_data()
     except json.JSONDecodeError:
         logger.error(f"Error decoding JSON from {filename}. Creating a new one.")
-        return {"users": {}, "total_users": 0}
+        return _empty_data()
     except Exception as e:
         logger.exception(f"Error loading data: {e}")
         return None
 
-def save_data(data, filename="users_data_converted.json"):
-    """Saves user data to a JSON file."""
-    try:
-        with open(filename, "w") as f:
-            json.dump(data, f, indent=4)
-    except Exception as e:
-        logger.exception(f"Error saving data: {e}")
+
+def write_user_file(filename, users, extra=None, chunk_size=10000):
+    """Writes ``(user_id, record)`` pairs to a temporary file and atomically replaces ``filename``.
+
+    ``users`` may be any iterable, including a generator; it is encoded and
+    written in chunks so the whole document never has to exist as one string
+    in memory. ``extra`` holds the other top-level keys, e.g. ``total_users``.
+    Returns the number of users written.
+    """
+    encode = json.JSONEncoder(separators=(",", ":")).encode
+    tmp_filename = f"{filename}.tmp"
+    count = 0
+    with open(tmp_filename, "w") as f:
+        f.write('{"users":{')
+        separator = ""
+        chunk = []
+        for user_id, user in users:
+            chunk.append(f'"{user_id}":{encode(user.to_dict())}')
+            if len(chunk) >= chunk_size:
+                f.write(separator + ",".join(chunk))
+                separator = ","
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            f.write(separator + ",".join(chunk))
+            count += len(chunk)
+        f.write("}")
+        for key, value in (extra or {}).items():
+            f.write(f",{encode(key)}:{encode(value)}")
+        f.write("}")
+    os.replace(tmp_filename, filename)
+    return count
+
+
+def _write_file(data, filename):
+    """Writes user data to a temporary file and atomically replaces the old one."""
+    write_user_file(filename, data["users"].items(), {key: value for key, value in data.items() if key != "users"})
+
+
+class UserStore:
+    """Process-wide in-memory copy of a user data file.
+
+    The file is parsed once, reads are served from memory and writes only mark
+    the store dirty. :meth:`flush` writes the data back when something changed;
+    it is called periodically by the bot and once more at shutdown.
+    """
+
+    def __init__(self, filename=DEFAULT_FILENAME):
+        self.filename = filename
+        self._lock = threading.RLock()
+        # Called with the referrer id whenever a referral is credited
+        self.on_referral = None
+        self._data = None
+        self._dirty = False
+
+    def load(self):
+        """Loads the file into memory if it has not been loaded yet."""
+        with self._lock:
+            if self._data is None:
+                data = _read_file(self.filename)
+                if data is None:
+                    return None
+                data.setdefault("total_users", len(data["users"]))
+                self._data = data
+            return self._data
+
+    @property
+    def dirty(self):
+        return self._dirty
+
+    def _write_snapshot(self, data):
+        _write_file(data, self.filename)
+
+    def load_data(self):
+        """Returns a snapshot of the user data that callers may modify freely."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return None
+            return {"users": data["users"].copy(), "total_users": data["total_users"]}
+
+    def save_data(self, data):
+        """Replaces the user data; the change is written on the next flush."""
+        with self._lock:
+            self._data = {
+                "users": UserTable(data.get("users", {})),
+                "total_users": data.get("total_users", 0),
+            }
+            self._dirty = True
+
+    def manage_user(self, user_id, username, referred_by=None, registered_at=None):
+        """Manages user data and referral counts. Returns True if this is a new user."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return False
+
+            users = data["users"]
+            is_new_user = user_id not in users
+
+            if not is_new_user:
+                return False
+
+            # 0 records an unknown registration time (users from before it was stored)
+            if registered_at is None:
+                registered_at = int(time.time())
+            users.add(user_id, username, registered_at=registered_at)
+            data["total_users"] += 1
+
+            if referred_by:
+                if users.increment_referrals(referred_by) is not None:
+                    users.set_referrer(user_id, referred_by)
+                    if self.on_referral:
+                        self.on_referral(int(referred_by))
+                else:
+                    logger.warning(f"Referrer {referred_by} not found.")
+
+            self._dirty = True
+            return True
+
+    def manage_users_batch(self, records):
+        """Applies ``(user_id, username, referred_by)`` records in order. Returns their ``is_new_user`` flags."""
+        with self._lock:
+            return [self.manage_user(*record) for record in records]
+
+    def remove_users(self, user_ids):
+        """Removes the given users. Returns the number of users actually removed."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return 0
+
+            users = data["users"]
+            removed = 0
+            for user_id in user_ids:
+                if users.pop(user_id) is not None:
+                    removed += 1
+
+            if removed:
+                data["total_users"] = len(users)
+                self._dirty = True
+            return removed
+
+    def get_referral_count(self, user_id):
+        """Gets the referral count for a user."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return 0
+
+            return data["users"].referral_count(user_id) or 0
+
+    def get_user(self, user_id):
+        """Returns the :class:`UserRecord` of a user, or ``None`` if the user is unknown."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return None
+            return data["users"].get(user_id)
+
+    def get_referrals(self, user_id, after=None, limit=20):
+        """Returns ``(total, [(user_id, username), ...])`` for the users referred by ``user_id`` after the id ``after``."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return 0, []
+
+            users = data["users"]
+            page = [
+                (referred_id, users[referred_id].username)
+                for referred_id in users.referrals(user_id, after, limit)
+            ]
+            return users.referral_list_size(user_id), page
+
+    def iter_user_chunks(self, chunk_size=1000):
+        """Yields lists of ``(user_id, UserRecord)`` pairs, ``chunk_size`` users at a time.
+
+        The lock is only held while a chunk is read, so registrations continue
+        in between; users registered during the walk are included.
+        """
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return
+            users = data["users"]
+            users.pin()
+        try:
+            position = 0
+            while True:
+                with self._lock:
+                    chunk, position = users.read_rows(position, chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            with self._lock:
+                users.unpin()
+
+    def count_segment(self, segment):
+        """Returns the number of users in a :class:`segments.Segment`, answered from the table indexes."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return 0
+            users = data["users"]
+            if segment.kind == "min_referrals":
+                return users.count_at_least(segment.value)
+            if segment.kind == "below_referrals":
+                return len(users) - users.count_at_least(segment.value)
+            if segment.kind == "referred_by":
+                return users.referral_list_size(segment.value)
+            if segment.kind == "registered":
+                return users.count_registered(segment.value, segment.end)
+            return len(users)
+
+    def iter_segment_chunks(self, segment, chunk_size=1000):
+        """Yields lists of the user ids in ``segment``, ``chunk_size`` ids at a time.
+
+        Referral segments are read from the leaderboard and referral indexes;
+        the others walk the pinned columns, starting at the binary-searched
+        registration range when there is one.
+        """
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return
+            users = data["users"]
+            if segment.kind == "min_referrals":
+                ids = users.ids_at_least(segment.value)
+            elif segment.kind != "referred_by":
+                users.pin()
+        if segment.kind == "min_referrals":
+            for start in range(0, len(ids), chunk_size):
+                yield ids[start:start + chunk_size]
+            return
+        if segment.kind == "referred_by":
+            after = None
+            while True:
+                with self._lock:
+                    chunk = users.referrals(segment.value, after, chunk_size)
+                if not chunk:
+                    return
+                after = chunk[-1]
+                yield chunk
+
+        try:
+            position, end, below, registered = 0, None, None, None
+            if segment.kind == "below_referrals":
+                below = segment.value
+            elif segment.kind == "registered":
+                registered = (segment.value, segment.end)
+                with self._lock:
+                    rows = users.registration_rows(segment.value, segment.end)
+                if rows is not None:
+                    position, end = rows
+            while True:
+                with self._lock:
+                    chunk, position = users.read_ids(position, chunk_size, end, below, registered)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            with self._lock:
+                users.unpin()
+
+    def get_top(self, n=10):
+        """Returns the top ``n`` referrers as ``[(user_id, username, referral_count), ...]``."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return []
+            return data["users"].top(n)
+
+    def get_rank(self, user_id):
+        """Returns ``(rank, referral_count)`` of a user, or ``None`` if they have no referrals."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return None
+            return data["users"].rank(user_id)
+
+    def get_total_user_count(self):
+        """Gets the total number of registered users."""
+        with self._lock:
+            data = self.load()
+            if data is None:
+                return 0
+            return data["total_users"]
+
+    def flush(self):
+        """Writes the data to disk if it changed. Returns True if a write happened."""
+        with self._lock:
+            if not self._dirty or self._data is None:
+                return False
+            try:
+                self._write_snapshot(self._data)
+            except Exception as e:
+                logger.exception(f"Error saving data: {e}")
+                return False
+            self._dirty = False
+            return True
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+_windows = ReferralWindows(WINDOWS_FILENAME)
+
+
+def _create_store(filename):
+    if filename is None:
+        from sqlite_store import open_store
+        store = open_store(get_sqlite_path(), json_filename=DEFAULT_FILENAME)
+    elif filename != DEFAULT_FILENAME:
+        return UserStore(filename)
+    elif get_storage_backend() == "journal":
+        from journal_store import JournalUserStore
+        store = JournalUserStore(filename, compact_threshold=get_journal_compact_bytes())
+    else:
+        store = UserStore(filename)
+    # Only the bot's own store feeds the time-windowed leaderboards.
+    from recipients import data_path
+    _windows.filename = data_path(WINDOWS_FILENAME)
+    _windows.load()
+    store.on_referral = _windows.record
+    return store
+
+
+def get_store(filename=None):
+    """Returns the process-wide store for ``filename``, creating it on first use.
+
+    Without a filename the backend selected by ``STORAGE_BACKEND`` is used.
+    """
+    if filename is None and get_storage_backend() != "sqlite":
+        filename = DEFAULT_FILENAME
+    with _stores_lock:
+        store = _stores.get(filename)
+        if store is None:
+            store = _stores[filename] = _create_store(filename)
+        return store
+
+
+def flush_all():
+    """Flushes every store that has pending changes."""
+    for store in list(_stores.values()):
+        store.flush()
+    _windows.flush()
+
+
+atexit.register(flush_all)
+
+
+def load_data(filename=None):
+    """Loads user data. Served from memory or the database after the first call."""
+    return get_store(filename).load_data()
+
+def save_data(data, filename=None):
+    """Saves user data through the configured storage backend."""
+    get_store(filename).save_data(data)
+
+def is_available():
+    """Returns True if the user data could be loaded."""
+    return get_store().load() is not None
 
 def manage_user(user_id, username, referred_by=None):
     """Manages user data and referral counts. Returns True if this is a new user."""
-    data = load_data()
-    if data is None:
-        return False
-
-    users = data.get("users", {})
-    total_users = data.get("total_users", 0)
-
-    user_id_str = str(user_id)
-    is_new_user = user_id_str not in users
-
-    if is_new_user:
-        users[user_id_str] = {
-            "username": username,
-            "referral_count": 0,
-            "referred_by": None
-        }
-        total_users += 1
-        data["total_users"] = total_users
-
-    if referred_by and is_new_user:  # Only process referral if it's a new user
-        referred_by_str = str(referred_by)
-        if referred_by_str in users:
-            users[referred_by_str]["referral_count"] += 1
-            users[user_id_str]["referred_by"] = int(referred_by)
-        else:
-            logger.warning(f"Referrer {referred_by} not found.")
-
-    data["users"] = users
-    save_data(data)
-    return is_new_user
+    return get_store().manage_user(user_id, username, referred_by=referred_by)
+
+def manage_users_batch(records, persist=True):
+    """Registers many users in one pass. Returns the ``is_new_user`` flag of every record.
+
+    ``records`` are ``(user_id, username, referred_by)`` tuples and are applied
+    in order, so a referrer registered earlier in the same batch is credited
+    and a user listed twice is only new the first time. With ``persist`` the
+    store is written once after the whole batch.
+    """
+    store = get_store()
+    results = store.manage_users_batch([tuple(record) for record in records])
+    if persist:
+        store.flush()
+    return results
+
+def remove_users(user_ids):
+    """Removes users, e.g. the ones that blocked the bot. Returns the number removed."""
+    return get_store().remove_users(user_ids)
 
 def get_referral_count(user_id):
     """Gets the referral count for a user."""
-    data = load_data()
-    if data is None:
-        return 0
+    return get_store().get_referral_count(user_id)
 
-    users = data.get("users", {})
-    user = users.get(str(user_id))
+def get_referrals(user_id, after=None, limit=20):
+    """Gets one page of the users referred by ``user_id`` as ``(total, [(user_id, username), ...])``.
 
-    if user:
-        return user.get("referral_count", 0)
-    else:
-        return 0
+    Pages are in user id order; pass the last id of a page as ``after`` to get the next one.
+    """
+    return get_store().get_referrals(user_id, after=after, limit=limit)
+
+def count_segment(segment):
+    """Gets the number of users in a :class:`segments.Segment`."""
+    return get_store().count_segment(segment)
+
+def iter_segment(segment, chunk_size=1000):
+    """Streams the user ids in a :class:`segments.Segment` from the store's indexes."""
+    for chunk in get_store().iter_segment_chunks(segment, chunk_size):
+        yield from chunk
+
+def get_top(n=10):
+    """Gets the top ``n`` referrers as ``[(user_id, username, referral_count), ...]``."""
+    return get_store().get_top(n)
+
+def get_rank(user_id):
+    """Gets ``(rank, referral_count)`` of a user on the leaderboard, or ``None`` without referrals."""
+    return get_store().get_rank(user_id)
+
+def get_window_top(window, n=10):
+    """Gets the top ``n`` referrers of the last ``window`` ("day", "week" or "month").
+
+    Returns ``[(user_id, username, referral_count), ...]`` with the counts of that window.
+    """
+    store = get_store()
+    result = []
+    for referrer_id, count in _windows.top(window, n):
+        user = store.get_user(referrer_id)
+        result.append((referrer_id, user.username if user else None, count))
+    return result
 
 def get_total_user_count():
     """Gets the total number of registered users."""
-    data = load_data()
-    if data is None:
-        return 0
+    return get_store().get_total_user_count()
+
+
+# Async API: the same operations, run on a dedicated single-thread executor so
+# parsing, serialization and disk I/O never block the event loop. A single
+# worker also keeps every storage operation strictly ordered.
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-storage")
+_pending_limit = None
+_stats = {
+    "operations": 0,
+    "pending": 0,
+    "max_pending": 0,
+    "storage_seconds": 0.0,
+    "max_storage_seconds": 0.0,
+    "loop_lag_seconds": 0.0,
+    "max_loop_lag_seconds": 0.0,
+    "write_batches": 0,
+    "batched_writes": 0,
+    "max_write_batch": 0,
+}
+
+
+def _get_pending_limit():
+    global _pending_limit
+    if _pending_limit is None:
+        _pending_limit = asyncio.Semaphore(get_storage_max_pending())
+    return _pending_limit
+
+
+async def _run(func, *args, **kwargs):
+    """Runs a storage call on the storage executor.
+
+    At most ``STORAGE_MAX_PENDING`` calls are queued at once; further callers
+    wait here instead of growing the executor queue without bound.
+    """
+    async with _get_pending_limit():
+        _stats["pending"] += 1
+        _stats["max_pending"] = max(_stats["max_pending"], _stats["pending"])
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                _executor, functools.partial(func, *args, **kwargs)
+            )
+        finally:
+            elapsed = time.perf_counter() - started
+            _stats["pending"] -= 1
+            _stats["operations"] += 1
+            _stats["storage_seconds"] += elapsed
+            _stats["max_storage_seconds"] = max(_stats["max_storage_seconds"], elapsed)
+
+
+def get_storage_stats():
+    """Returns counters about the async storage API and event loop lag."""
+    return dict(_stats)
+
+
+async def monitor_loop_lag(interval=1.0):
+    """Measures how long the event loop was blocked and logs when it exceeds LOOP_LAG_WARNING."""
+    loop = asyncio.get_running_loop()
+    warn_threshold = get_loop_lag_warning()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        _stats["loop_lag_seconds"] = lag
+        _stats["max_loop_lag_seconds"] = max(_stats["max_loop_lag_seconds"], lag)
+        if lag > warn_threshold:
+            logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+
+
+class UserWriter:
+    """Single writer task that owns all user mutations.
+
+    Callers enqueue mutations and await a future. The writer takes every
+    request waiting in the queue, applies consecutive registrations as one
+    batch on the storage executor (one journal fsync or one SQLite transaction
+    per batch) and resolves each caller's future with its own result. Under a
+    burst of ``/start`` updates the cost is one write per batch instead of one
+    per user, and no update can be lost to interleaved read-modify-write cycles.
+    """
+
+    def __init__(self, max_batch_size=500):
+        self.max_batch_size = max_batch_size
+        self._queue = asyncio.Queue(maxsize=get_storage_max_pending())
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Processes everything that is already queued, then stops the writer task."""
+        if self.running:
+            await self._queue.put(None)
+            await self._task
+        self._task = None
+
+    async def submit(self, op, *args):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, args, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stopping = False
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            _stats["write_batches"] += 1
+            _stats["batched_writes"] += len(batch)
+            _stats["max_write_batch"] = max(_stats["max_write_batch"], len(batch))
+            await self._commit(batch)
+            if stopping:
+                return
+
+    async def _commit(self, batch):
+        # Consecutive registrations go to the store as one batch; removals are
+        # applied in their queue position so ordering is preserved.
+        index = 0
+        while index < len(batch):
+            op, args, future = batch[index]
+            if op == "remove":
+                await self._resolve([future], _run(remove_users, *args))
+                index += 1
+                continue
+            end = index
+            while end < len(batch) and batch[end][0] == "add":
+                end += 1
+            records = [args for _, args, _ in batch[index:end]]
+            futures = [future for _, _, future in batch[index:end]]
+            await self._resolve(futures, _run(manage_users_batch, records, persist=False), many=True)
+            index = end
+
+    async def _resolve(self, futures, coro, many=False):
+        try:
+            result = await coro
+        except Exception as e:
+            logger.exception(f"Error committing {len(futures)} user updates: {e}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        results = result if many else [result]
+        for future, value in zip(futures, results):
+            if not future.done():
+                future.set_result(value)
+
+
+_writer = None
+
+
+def start_writer():
+    """Starts the single writer task; mutations from the async API go through it afterwards."""
+    global _writer
+    if _writer is None:
+        _writer = UserWriter()
+    _writer.start()
+
+
+async def stop_writer():
+    """Commits queued mutations and stops the writer task."""
+    if _writer is not None:
+        await _writer.stop()
+
+
+async def is_available_async():
+    """Async variant of :func:`is_available`."""
+    return await _run(is_available)
+
+async def load_data_async(filename=None):
+    """Async variant of :func:`load_data`."""
+    return await _run(load_data, filename)
+
+async def save_data_async(data, filename=None):
+    """Async variant of :func:`save_data`."""
+    await _run(save_data, data, filename)
+
+async def manage_user_async(user_id, username, referred_by=None):
+    """Async variant of :func:`manage_user`, committed by the writer task when it runs."""
+    if _writer is not None and _writer.running:
+        return await _writer.submit("add", user_id, username, referred_by)
+    return await _run(manage_user, user_id, username, referred_by=referred_by)
+
+async def remove_users_async(user_ids):
+    """Async variant of :func:`remove_users`, committed by the writer task when it runs."""
+    if _writer is not None and _writer.running:
+        return await _writer.submit("remove", list(user_ids))
+    return await _run(remove_users, list(user_ids))
+
+async def get_referral_count_async(user_id):
+    """Async variant of :func:`get_referral_count`."""
+    return await _run(get_referral_count, user_id)
+
+async def get_referrals_async(user_id, after=None, limit=20):
+    """Async variant of :func:`get_referrals`."""
+    return await _run(get_referrals, user_id, after=after, limit=limit)
+
+async def count_segment_async(segment):
+    """Async variant of :func:`count_segment`."""
+    return await _run(count_segment, segment)
+
+async def iter_segment_async(segment, chunk_size=1000):
+    """Async variant of :func:`iter_segment`; each chunk is read on the storage executor."""
+    chunks = get_store().iter_segment_chunks(segment, chunk_size)
+    try:
+        while True:
+            chunk = await _run(next, chunks, None)
+            if chunk is None:
+                return
+            for user_id in chunk:
+                yield user_id
+    finally:
+        await _run(chunks.close)
+
+async def get_top_async(n=10):
+    """Async variant of :func:`get_top`."""
+    return await _run(get_top, n)
+
+async def get_rank_async(user_id):
+    """Async variant of :func:`get_rank`."""
+    return await _run(get_rank, user_id)
+
+async def get_window_top_async(window, n=10):
+    """Async variant of :func:`get_window_top`."""
+    return await _run(get_window_top, window, n)
+
+async def get_total_user_count_async():
+    """Async variant of :func:`get_total_user_count`."""
+    return await _run(get_total_user_count)
 
-    return data.get("total_users", 0)
\ No newline at end of file
+async def flush_all_async():
+    """Async variant of :func:`flush_all`."""
+    await _run(flush_all)
@@ -0,0 +1,419 @@
+"""
+Compact in-memory representation of the user table.
+
+A plain ``{"123": {"username": ..., "referral_count": ..., "referred_by": ...}}``
+costs a dict per user plus a string key, around 370 bytes per user.
+:class:`UserTable` stores users column-wise instead: ids, referral counts,
+referrers and registration times live in ``array`` columns, usernames are
+packed as UTF-8 into one ``bytearray``, and a single ``dict`` maps the integer
+user id to its row. That brings a user down to roughly 160 bytes.
+
+The table keeps the dict-style access the rest of the bot already uses
+(``users.keys()``, ``users[user_id]``, ``user["referral_count"]``,
+``user.get("username")``). Reading a user returns a small :class:`UserRecord`
+snapshot; changes go through the table's own methods.
+"""
+import bisect
+from array import array
+
+
+class UserRecord:
+    """A single user: username, referral count, the id of the referrer and the registration time."""
+
+    __slots__ = ("username", "referral_count", "referred_by", "registered_at")
+
+    def __init__(self, username, referral_count=0, referred_by=None, registered_at=None):
+        self.username = username
+        self.referral_count = referral_count
+        self.referred_by = referred_by
+        self.registered_at = registered_at
+
+    @classmethod
+    def from_dict(cls, user):
+        if isinstance(user, cls):
+            return user
+        return cls(
+            user.get("username"),
+            user.get("referral_count", 0),
+            user.get("referred_by"),
+            user.get("registered_at")
+        )
+
+    def to_dict(self):
+        return {
+            "username": self.username,
+            "referral_count": self.referral_count,
+            "referred_by": self.referred_by,
+            "registered_at": self.registered_at
+        }
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def __eq__(self, other):
+        if isinstance(other, UserRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return f"UserRecord({self.username!r}, {self.referral_count}, {self.referred_by}, {self.registered_at})"
+
+
+class UserTable:
+    """Column-oriented mapping of integer user id to user data.
+
+    Lookups accept ``int`` or ``str`` ids, so code written against the JSON
+    layout (string keys) keeps working; iteration yields ``int`` ids in
+    registration order. Removed users leave a hole in the columns until more
+    than half of the rows are holes, then the columns are rebuilt.
+
+    Rows are kept in registration-time order (users without a registration
+    time first), so the ``_registered`` column doubles as a sorted index for
+    date-range queries. If an out-of-order time is ever added, range queries
+    fall back to a column scan until the next compaction restores the order.
+    """
+
+    __slots__ = (
+        "_rows", "_ids", "_counts", "_referrers", "_name_offsets", "_names", "_holes",
+        "_referrals", "_by_count", "_distinct_counts", "_pins", "_registered", "_time_sorted",
+    )
+
+    def __init__(self, users=None):
+        self._rows = {}
+        self._ids = array("q")
+        self._counts = array("i")
+        self._referrers = array("q")
+        self._name_offsets = array("Q")
+        self._names = bytearray()
+        self._registered = array("q")
+        self._time_sorted = True
+        self._holes = 0
+        # Reverse referral index: referrer id -> sorted ids of the users it
+        # referred, so pages can continue after the last id shown.
+        self._referrals = {}
+        # Leaderboard index: referral count -> ids with that count (in the
+        # order they reached it), plus the sorted distinct counts. Only users
+        # with at least one referral are indexed.
+        self._by_count = {}
+        self._distinct_counts = []
+        # Number of open row readers; compaction waits until there are none
+        # so row positions stay stable for them.
+        self._pins = 0
+        if users:
+            items = users.items()
+            times = [user.get("registered_at") or 0 for user in users.values()]
+            if any(earlier > later for earlier, later in zip(times, times[1:])):
+                order = sorted(range(len(times)), key=times.__getitem__)
+                items = list(items)
+                items = (items[index] for index in order)
+            del times
+            for user_id, user in items:
+                self[user_id] = user
+
+    @staticmethod
+    def _key(user_id):
+        try:
+            return int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+    def _username(self, row):
+        start = self._name_offsets[row]
+        end = self._name_offsets[row + 1] if row + 1 < len(self._name_offsets) else len(self._names)
+        return self._names[start:end].decode() if end > start else None
+
+    def _record(self, row):
+        referred_by = self._referrers[row]
+        return UserRecord(self._username(row), self._counts[row], referred_by or None, self._registered[row] or None)
+
+    def add(self, user_id, username, referral_count=0, referred_by=None, registered_at=None):
+        """Adds a user, or overwrites the existing row for ``user_id``."""
+        user_id = int(user_id)
+        row = self._rows.get(user_id)
+        if row is not None:
+            self._drop_row(row)
+        self._rows[user_id] = len(self._ids)
+        self._ids.append(user_id)
+        self._counts.append(referral_count or 0)
+        self._index_count(user_id, referral_count or 0)
+        self._referrers.append(0)
+        self._name_offsets.append(len(self._names))
+        if username:
+            self._names += str(username).encode()
+        registered_at = int(registered_at or 0)
+        if self._registered and registered_at < self._registered[-1]:
+            self._time_sorted = False
+        self._registered.append(registered_at)
+        if referred_by:
+            self.set_referrer(user_id, referred_by)
+
+    def referral_count(self, user_id):
+        """Returns the referral count of ``user_id``, or ``None`` if the user is unknown."""
+        row = self._rows.get(self._key(user_id))
+        return None if row is None else self._counts[row]
+
+    def increment_referrals(self, user_id, amount=1):
+        """Adds ``amount`` to the referral count. Returns the new count, or ``None`` if the user is unknown."""
+        row = self._rows.get(self._key(user_id))
+        if row is None:
+            return None
+        user_id = self._ids[row]
+        self._unindex_count(user_id, self._counts[row])
+        self._counts[row] += amount
+        self._index_count(user_id, self._counts[row])
+        return self._counts[row]
+
+    def _index_count(self, user_id, count):
+        if count <= 0:
+            return
+        bucket = self._by_count.get(count)
+        if bucket is None:
+            bucket = self._by_count[count] = {}
+            bisect.insort(self._distinct_counts, count)
+        bucket[user_id] = None
+
+    def _unindex_count(self, user_id, count):
+        bucket = self._by_count.get(count)
+        if bucket is None:
+            return
+        bucket.pop(user_id, None)
+        if not bucket:
+            del self._by_count[count]
+            del self._distinct_counts[bisect.bisect_left(self._distinct_counts, count)]
+
+    def top(self, n):
+        """Returns up to ``n`` ``(user_id, username, referral_count)`` tuples, highest count first.
+
+        Walks the leaderboard index from the highest count down, so the cost is
+        O(n) plus the number of distinct counts visited, independent of the
+        number of users.
+        """
+        result = []
+        for count in reversed(self._distinct_counts):
+            for user_id in self._by_count[count]:
+                if len(result) >= n:
+                    return result
+                result.append((user_id, self._username(self._rows[user_id]), count))
+        return result
+
+    def rank(self, user_id):
+        """Returns ``(rank, referral_count)`` of a user on the leaderboard, or ``None`` without referrals."""
+        count = self.referral_count(user_id)
+        if not count:
+            return None
+        position = bisect.bisect_right(self._distinct_counts, count)
+        ahead = sum(len(self._by_count[higher]) for higher in self._distinct_counts[position:])
+        return ahead + 1, count
+
+    def count_at_least(self, n):
+        """Returns the number of users with at least ``n`` (>= 1) referrals, from the leaderboard index."""
+        position = bisect.bisect_left(self._distinct_counts, max(n, 1))
+        return sum(len(self._by_count[count]) for count in self._distinct_counts[position:])
+
+    def ids_at_least(self, n):
+        """Returns the ids of users with at least ``n`` (>= 1) referrals, from the leaderboard index."""
+        position = bisect.bisect_left(self._distinct_counts, max(n, 1))
+        return [user_id for count in self._distinct_counts[position:] for user_id in self._by_count[count]]
+
+    def registration_rows(self, start, end):
+        """Returns the row range ``(lo, hi)`` holding users registered in ``[start, end)``.
+
+        Uses binary search over the registration-time column; returns ``None``
+        when the rows are not in time order. ``hi`` is ``None`` when the range
+        reaches the last row, so users registered later are included too.
+        """
+        if not self._time_sorted:
+            return None
+        hi = bisect.bisect_left(self._registered, end)
+        return bisect.bisect_left(self._registered, start), hi if hi < len(self._registered) else None
+
+    def count_registered(self, start, end):
+        """Returns the number of users registered in ``[start, end)``."""
+        rows = self.registration_rows(start, end)
+        if rows is None:
+            return sum(
+                1 for row in self._rows.values() if start <= self._registered[row] < end
+            )
+        lo, hi = rows
+        ids = self._ids[lo:hi]
+        return len(ids) - ids.count(0)
+
+    def read_ids(self, position, limit, end=None, below=None, registered=None):
+        """Returns up to ``limit`` user ids from rows ``[position, end)`` and the next position.
+
+        ``below`` keeps users with fewer referrals; ``registered`` is a
+        ``(start, end)`` time range. An empty list means the walk is over.
+        Pin the table while walking it.
+        """
+        ids = []
+        end = len(self._ids) if end is None else min(end, len(self._ids))
+        while position < end and len(ids) < limit:
+            user_id = self._ids[position]
+            if (
+                user_id
+                and (below is None or self._counts[position] < below)
+                and (registered is None or registered[0] <= self._registered[position] < registered[1])
+            ):
+                ids.append(user_id)
+            position += 1
+        return ids, position
+
+    def set_referrer(self, user_id, referred_by):
+        """Sets the referrer of ``user_id`` and keeps the reverse index in sync."""
+        user_id = int(user_id)
+        row = self._rows[user_id]
+        self._unlink_referral(user_id, self._referrers[row])
+        referred_by = int(referred_by) if referred_by else 0
+        self._referrers[row] = referred_by
+        if referred_by:
+            referred = self._referrals.setdefault(referred_by, array("q"))
+            if referred and user_id < referred[-1]:
+                referred.insert(bisect.bisect_left(referred, user_id), user_id)
+            else:
+                referred.append(user_id)
+
+    def _unlink_referral(self, user_id, referred_by):
+        referred = self._referrals.get(referred_by)
+        if referred is None:
+            return
+        position = bisect.bisect_left(referred, user_id)
+        if position < len(referred) and referred[position] == user_id:
+            del referred[position]
+        if not referred:
+            del self._referrals[referred_by]
+
+    def referrals(self, user_id, after=None, limit=None):
+        """Returns the ids of the users referred by ``user_id`` in id order, starting after the id ``after``."""
+        referred = self._referrals.get(self._key(user_id))
+        if referred is None:
+            return []
+        start = 0 if after is None else bisect.bisect_right(referred, after)
+        end = None if limit is None else start + limit
+        return referred[start:end].tolist()
+
+    def referral_list_size(self, user_id):
+        """Returns the number of current users whose referrer is ``user_id``."""
+        return len(self._referrals.get(self._key(user_id), ()))
+
+    def _drop_row(self, row):
+        self._unlink_referral(self._ids[row], self._referrers[row])
+        self._unindex_count(self._ids[row], self._counts[row])
+        self._ids[row] = 0
+        self._holes += 1
+
+    def _compact(self):
+        table = UserTable()
+        # Rebuilding in (registration time, row) order also restores the time order.
+        rows = sorted(self._rows.items(), key=lambda item: (self._registered[item[1]], item[1]))
+        for user_id, row in rows:
+            table.add(user_id, self._username(row), self._counts[row], registered_at=self._registered[row])
+        # Indexes are kept as they are so their ordering is preserved.
+        table._referrals = self._referrals
+        table._by_count = self._by_count
+        table._distinct_counts = self._distinct_counts
+        for user_id, row in self._rows.items():
+            table._referrers[table._rows[user_id]] = self._referrers[row]
+        for name in self.__slots__:
+            setattr(self, name, getattr(table, name))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __contains__(self, user_id):
+        return self._key(user_id) in self._rows
+
+    def __getitem__(self, user_id):
+        row = self._rows.get(self._key(user_id))
+        if row is None:
+            raise KeyError(user_id)
+        return self._record(row)
+
+    def __setitem__(self, user_id, user):
+        user = UserRecord.from_dict(user)
+        self.add(user_id, user.username, user.referral_count, user.referred_by, user.registered_at)
+
+    def __delitem__(self, user_id):
+        if self.pop(user_id) is None:
+            raise KeyError(user_id)
+
+    def get(self, user_id, default=None):
+        row = self._rows.get(self._key(user_id))
+        return default if row is None else self._record(row)
+
+    def pop(self, user_id, default=None):
+        row = self._rows.pop(self._key(user_id), None)
+        if row is None:
+            return default
+        record = self._record(row)
+        self._drop_row(row)
+        if not self._pins and self._holes > 1024 and self._holes * 2 > len(self._ids):
+            self._compact()
+        return record
+
+    def pin(self):
+        """Keeps row positions stable (no compaction) until :meth:`unpin` is called."""
+        self._pins += 1
+
+    def unpin(self):
+        self._pins -= 1
+
+    def read_rows(self, position, limit):
+        """Returns up to ``limit`` ``(user_id, record)`` pairs starting at row ``position``, and the next position.
+
+        Used to walk the table in chunks while it keeps changing; pin the table
+        for the duration of the walk.
+        """
+        chunk = []
+        end = len(self._ids)
+        while position < end and len(chunk) < limit:
+            user_id = self._ids[position]
+            if user_id:
+                chunk.append((user_id, self._record(position)))
+            position += 1
+        return chunk, position
+
+    def keys(self):
+        return self._rows.keys()
+
+    def values(self):
+        for row in self._rows.values():
+            yield self._record(row)
+
+    def items(self):
+        for user_id, row in self._rows.items():
+            yield user_id, self._record(row)
+
+    def copy(self):
+        """Returns an independent copy of the table."""
+        table = UserTable()
+        table._rows = self._rows.copy()
+        table._ids = self._ids[:]
+        table._counts = self._counts[:]
+        table._referrers = self._referrers[:]
+        table._name_offsets = self._name_offsets[:]
+        table._names = self._names[:]
+        table._registered = self._registered[:]
+        table._time_sorted = self._time_sorted
+        table._holes = self._holes
+        table._referrals = {referrer: referred[:] for referrer, referred in self._referrals.items()}
+        table._by_count = {count: bucket.copy() for count, bucket in self._by_count.items()}
+        table._distinct_counts = self._distinct_counts[:]
+        return table
+
+
+def record_object_hook(obj):
+    """``json.load`` hook that turns user entries into records while the file is parsed."""
+    if "referral_count" in obj and "username" in obj:
+        return UserRecord.from_dict(obj)
+    return obj